@@ -4,81 +4,288 @@ The current structure preprocesses the G-code, extracts XYZUVW coordinates, and
 --------------------------------------------------------------------------------
 *  New functions:                                                              *
 *                                                                              *
-*  parse_file(file_path)                  Reads G-code into x, y, z, u, v, w   *
+*  parse_file(file_path, use_mmap)        Reads G-code into x, y, z, u, v, w   *
 *  comet_from_file(file_path)             Animates 2D motion + Top/Bottom plot *
 *  comet3_from_file(file_path)            Animates 3D motion + Top/Bottom plot *
 *  plot3d_static_from_file(file_path)     Static 3D plot + Top/Bottom plot     *
 *  save_to_excel(file_path)	          Saves data to Excel without prompt   *
+*  export(file_path, fmt, out_path)       Streams data to csv/parquet/feather  *
+*  parse_points(control_pts, ...)         Same arrays from points, no file     *
+*  comet_from_points(control_pts, ...)    Plots without a G-code (+ comet3_..) *
 --------------------------------------------------------------------------------
 @author: kangputong
 """
 
 # Cleaned and GUI-ready visualization module
+import os
+import time
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 import tkinter as tk
 from tkinter import ttk
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from gcode_parser import parse_gcode
+from toolpath_export import export_toolpath, export_path
+from texture_dual import texture_columns
+from dual_tool import violation_mask
+from stage_profiler import PROFILER, profiled
+
+LOD_AUTO_MOVES = 5000    # use LOD playback above this many moves
+LOD_DURATION = 20.0      # seconds for one full LOD pass
+LOD_MERGE_FRAMES = 4     # frames of tail before it is folded into the prefix
+LOD_GRID = 1000          # decimation grid cells across each axis span
+STATS_EVERY = 10         # frames between FPS label updates
+
+# Frame end indices so that n moves play in about `duration` seconds
+def frame_schedule(n, interval, duration):
+    num_frames = max(1, int(duration * 1000 / interval))
+    if n <= num_frames:
+        return np.arange(1, n + 1)
+    return np.unique(np.linspace(1, n, num_frames).round().astype(int))
+
+# Drop consecutive points that stay in the same grid cell (cell size tol per axis)
+def decimate_path(tol, *coords):
+    if len(coords[0]) < 3:
+        return coords
+    cells = np.floor(np.column_stack(coords) / tol).astype(np.int64)
+    keep = np.ones(len(cells), dtype=bool)
+    keep[1:-1] = np.any(cells[1:-1] != cells[:-2], axis=1)
+    return tuple(c[keep] for c in coords)
+
+# Update a 2D or 3D line artist from a tuple of coordinate arrays
+def set_line(line, coords):
+    line.set_data(coords[0], coords[1])
+    if len(coords) == 3:
+        line.set_3d_properties(coords[2])
+
+# Blitting comet animation engine, one per window.
+# Axes, grid and labels are drawn once into a cached background. Each frame only the
+# short tail line is drawn over that background and blitted; every LOD_MERGE_FRAMES
+# frames the tail (decimated in LOD mode) is painted into the background and appended
+# to the static prefix line, which is only used when the figure is fully redrawn.
+# Frames are timed against the wall clock: when rendering falls behind, the frames
+# that are already late are dropped so playback keeps its pace.
+class CometAnimator:
+    def __init__(self, window, canvas, coords, prefix_line, line, interval,
+                 lod=None, duration=LOD_DURATION, stats_label=None):
+        self.window = window
+        self.canvas = canvas
+        self.coords = tuple(np.asarray(c) for c in coords)
+        self.prefix_line = prefix_line
+        self.line = line
+        self.interval = interval
+        self.stats_label = stats_label
+        self.ax, self.fig = line.axes, line.figure
+
+        n = len(self.coords[0])
+        self.lod = n > LOD_AUTO_MOVES if lod is None else lod
+        self.frame_ends = frame_schedule(n, interval, duration) if self.lod else np.arange(1, n + 1)
+        spans = np.array([np.ptp(c) for c in self.coords])
+        self.tol = np.where(spans > 0, spans, 1.0) / LOD_GRID
+        # Folded chunks share their end point, hence the extra room
+        self.prefix_buf = tuple(np.empty(n + len(self.frame_ends)) for _ in self.coords)
+
+        self.stopped = False
+        self.background = None
+        self.frames_drawn = 0
+        self.frames_dropped = 0
+        self.fps = 0.0
+        self.render_ms = 0.0
+
+        line.set_animated(True)
+        canvas.mpl_connect('draw_event', self._save_background)
+        window.protocol("WM_DELETE_WINDOW", self.close)
+
+    def start(self):
+        self.window.after(0, self._restart)
+
+    def stop(self):
+        self.stopped = True
+
+    def close(self):
+        self.stop()
+        self.window.destroy()
+
+    def _save_background(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    # Begin a new pass from the first move
+    def _restart(self):
+        if self.stopped:
+            return
+        self.frame = -1
+        self.last_fold = -1
+        self.start_idx = 0
+        self.prefix_len = 0
+        empty = tuple(c[:0] for c in self.coords)
+        set_line(self.prefix_line, empty)
+        set_line(self.line, empty)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.t0 = time.perf_counter()
+        self.last_tick = None
+        self._tick()
+
+    def _tick(self):
+        if self.stopped:
+            return
+        now = time.perf_counter()
+        last = len(self.frame_ends) - 1
+
+        # Governor: show the frame that is due now, dropping any we fell behind on
+        due = int((now - self.t0) * 1000 / self.interval)
+        frame = max(self.frame + 1, min(due, last))
+        self.frames_dropped += frame - self.frame - 1
+        self._draw_frame(frame)
+        self._update_stats(now, time.perf_counter() - now)
+
+        if frame == last:
+            self.window.after(self.interval, self._restart)  # Loop forever
+            return
+        delay = self.t0 + (frame + 1) * self.interval / 1000 - time.perf_counter()
+        self.window.after(max(1, int(delay * 1000)), self._tick)
+
+    def _draw_frame(self, frame):
+        end = self.frame_ends[frame]
+        self.canvas.restore_region(self.background)
+        if frame - self.last_fold >= LOD_MERGE_FRAMES or frame == len(self.frame_ends) - 1:
+            chunk = tuple(c[self.start_idx:end] for c in self.coords)
+            if self.lod:
+                chunk = decimate_path(self.tol, *chunk)
+            m = len(chunk[0])
+            for buf, c in zip(self.prefix_buf, chunk):
+                buf[self.prefix_len:self.prefix_len + m] = c
+            self.prefix_len += m
+            set_line(self.prefix_line, tuple(buf[:self.prefix_len] for buf in self.prefix_buf))
+            # Paint the chunk into the background once, then restart the tail at its end
+            set_line(self.line, chunk)
+            self.ax.draw_artist(self.line)
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+            self.start_idx = end - 1
+            self.last_fold = frame
+        set_line(self.line, tuple(c[self.start_idx:end] for c in self.coords))
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.fig.bbox)
+        self.frame = frame
+        self.frames_drawn += 1
+
+    # Smoothed frames per second and render time, shown under the plot
+    def _update_stats(self, now, render_time):
+        if self.last_tick is not None and now > self.last_tick:
+            rate = 1.0 / (now - self.last_tick)
+            self.fps = 0.9 * self.fps + 0.1 * rate if self.fps else rate
+        self.last_tick = now
+        self.render_ms = 0.9 * self.render_ms + 100 * render_time if self.render_ms else 1000 * render_time
+        if self.stats_label is not None and self.frames_drawn % STATS_EVERY == 0:
+            self.stats_label.config(text=f"{self.fps:.1f} fps | {self.render_ms:.1f} ms/frame | "
+                                         f"{self.frames_dropped} dropped")
 
 class AmplVisualization:
+    # cache: optional ToolpathCache, so repeated loads skip reparsing the text
+    def __init__(self, cache=None):
+        self.cache = cache
+
     # Parse G-code text file into arrays of X, Y, Z, U, V, W
-    def parse_file(self, file_path):
-        data = []
-        with open(file_path, 'r') as file:
-            for line in file:
-                if line.startswith("X"):
-                    parts = line.strip().split()
-                    variables = {}
-                    for i in range(0, len(parts), 2):
-                        variables[parts[i]] = float(parts[i + 1])
-                    # Only append if both X and Y exist
-                    if "X" in variables and "Y" in variables:
-                        data.append([
-                            variables.get("X", 0.0),
-                            variables.get("Y", 0.0),
-                            variables.get("Z", 0.0),
-                            variables.get("U", 0.0),
-                            variables.get("V", 0.0),
-                            variables.get("W", 0.0)
-                        ])
-        array = np.array(data)
-        return array[:, 0], array[:, 1], array[:, 2], array[:, 3], array[:, 4], array[:, 5]
+    # (use_mmap=True memory-maps the file for programs larger than RAM)
+    @profiled("parse")
+    def parse_file(self, file_path, use_mmap=False):
+        if self.cache is not None:
+            x, y, z, u, v, w = self.cache.load(file_path)
+        else:
+            x, y, z, u, v, w = parse_gcode(file_path, use_mmap=use_mmap)
+        if PROFILER.enabled:
+            PROFILER.count("moves_parsed", len(x))
+            PROFILER.count("bytes_parsed", os.path.getsize(file_path))
+        return x, y, z, u, v, w
+
+    # Same arrays straight from ordered control points, as write_Gcodes would emit
+    # them, without writing or parsing a file (for previews before saving)
+    @profiled("expand")
+    def parse_points(self, control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance=None, bottom_tool=None,
+                     profile=None):
+        x, y, z, u, v, w = texture_columns(control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance, bottom_tool,
+                                           profile)
+        if PROFILER.enabled:
+            PROFILER.count("moves_expanded", len(x))
+        return x, y, z, u, v, w
+
+    # Moves where the bottom tool clashes with the top tool, None without a bottom tool
+    def clearance_moves(self, x, y, z, u, v, w, bottom_tool=None):
+        if bottom_tool is None or bottom_tool.strategy == "park":
+            return None
+        return violation_mask(np.column_stack([x, y, z]), np.column_stack([u, v, w]),
+                              bottom_tool.gap, bottom_tool.reach)
+
+    # Animate 2D comet plot from control points
+    @profiled("visualize")
+    def comet_from_points(self, control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance=None, bottom_tool=None,
+                          profile=None):
+        x, y, z, u, v, w = self.parse_points(control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance, bottom_tool,
+                                             profile)
+        self.comet(x, y)
+        self.plot_top_bottom(x, y, u, v, self.clearance_moves(x, y, z, u, v, w, bottom_tool))
+
+    # Animate 3D comet plot from control points
+    @profiled("visualize")
+    def comet3_from_points(self, control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance=None, bottom_tool=None,
+                           profile=None):
+        x, y, z, u, v, w = self.parse_points(control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance, bottom_tool,
+                                             profile)
+        self.comet3(x, y, z)
+        self.plot_top_bottom(x, y, u, v, self.clearance_moves(x, y, z, u, v, w, bottom_tool))
+
+    # Static 3D line plot from control points
+    @profiled("visualize")
+    def plot3d_static_from_points(self, control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance=None, bottom_tool=None,
+                                  profile=None):
+        x, y, z, u, v, w = self.parse_points(control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance, bottom_tool,
+                                             profile)
+        self.plot3d_static(x, y, z)
+        self.plot_top_bottom(x, y, u, v, self.clearance_moves(x, y, z, u, v, w, bottom_tool))
 
     # Animate 2D comet plot from file
+    @profiled("visualize")
     def comet_from_file(self, file_path):
         x, y, z, u, v, w = self.parse_file(file_path)
         self.comet(x, y)
         self.plot_top_bottom(x, y, u, v)
 
     # Animate 3D comet plot from file
+    @profiled("visualize")
     def comet3_from_file(self, file_path):
         x, y, z, u, v, w = self.parse_file(file_path)
         self.comet3(x, y, z)
         self.plot_top_bottom(x, y, u, v)
 
     # Static 3D line plot from file
+    @profiled("visualize")
     def plot3d_static_from_file(self, file_path):
         x, y, z, u, v, w = self.parse_file(file_path)
         self.plot3d_static(x, y, z)
         self.plot_top_bottom(x, y, u, v)
 
-    # Save parsed data into an Excel file
+    # Export the parsed columns as csv, parquet, feather or xlsx (see toolpath_export).
+    # Streams from the cached sidecar memmap when the cache has a fresh one, else from
+    # the file chunk by chunk, writing the sidecar on the way; the program is never
+    # loaded or parsed whole.
+    @profiled("export")
+    def export(self, file_path, fmt="xlsx", out_path=None, progress=None):
+        out_path = out_path or export_path(file_path, fmt)
+        if self.cache is None:
+            return export_toolpath(file_path, out_path, fmt, progress=progress)
+        cached = self.cache.load_cached(file_path)
+        if cached is not None:
+            return export_toolpath(cached, out_path, fmt, progress=progress)
+        with self.cache.sidecar_writer(file_path) as sidecar:
+            return export_toolpath(file_path, out_path, fmt, progress=progress, on_block=sidecar.add)
+
+    # Save parsed data into an Excel file (split over sheets past the row limit)
     def save_to_excel(self, file_path):
-        x, y, z, u, v, w = self.parse_file(file_path)
-        df = pd.DataFrame({
-            "X": x,
-            "Y": y,
-            "Z": z,
-            "U": u,
-            "V": v,
-            "W": w
-        })
-        excel_path = file_path.replace(".txt", ".xlsx")
-        df.to_excel(excel_path, index=False)
+        return self.export(file_path, "xlsx")
 
     # Basic comet animation 2D (red lines)
-    def comet(self, x, y):
+    # lod: level-of-detail playback (None = automatic for long programs)
+    def comet(self, x, y, lod=None, duration=LOD_DURATION):
         window = tk.Toplevel()
         window.title("Comet 2D View")
 
@@ -95,39 +302,22 @@ class AmplVisualization:
         
         plt.close(fig)
 
+        prefix_line, = ax.plot([], [], 'b-')
         line, = ax.plot([], [], 'b-')
-        
-        self.stop_animation = False  # Control flag
-        
-        def stop():
-            self.stop_animation = True
-        
-        def update(frame):
-            line.set_data(x[:frame+1], y[:frame+1])
-            canvas.draw_idle()
-            canvas.flush_events()
-
-        def animate():
-            def single_pass(frame=0):
-                if self.stop_animation:
-                    return  # Stop gracefully if requested
-                if frame < len(x):
-                    update(frame)
-                    window.update()
-                    window.after(50, lambda: single_pass(frame + 1))
-                else:
-                    single_pass(0)  # Loop forever
-
-            single_pass()
+
+        stats_label = ttk.Label(window, text="")
+        stats_label.pack()
+        animator = CometAnimator(window, canvas, (x, y), prefix_line, line, 50, lod, duration, stats_label)
 
         # Add Stop button
-        stop_button = ttk.Button(window, text="Stop Animation", command=stop)
+        stop_button = ttk.Button(window, text="Stop Animation", command=animator.stop)
         stop_button.pack(pady=10)
 
-        window.after(0, animate)
+        animator.start()
+        return animator
 
     # Basic comet animation 3D (blue lines)
-    def comet3(self, x, y, z):
+    def comet3(self, x, y, z, lod=None, duration=LOD_DURATION):
         window = tk.Toplevel()
         window.title("Comet 3D View")
 
@@ -147,36 +337,18 @@ class AmplVisualization:
         
         plt.close(fig)
 
+        prefix_line, = ax.plot([], [], [], 'b-')
         line, = ax.plot([], [], [], 'b-')
-        
-        self.stop_animation = False
-        
-        def stop():
-            self.stop_animation = True
-
-        def update(frame):
-            line.set_data(x[:frame+1], y[:frame+1])
-            line.set_3d_properties(z[:frame+1])
-            canvas.draw_idle()
-            canvas.flush_events()
-
-        def animate():
-            def single_pass(frame=0):
-                if self.stop_animation:
-                    return
-                if frame < len(x):
-                    update(frame)
-                    window.update()
-                    window.after(80, lambda: single_pass(frame + 1))
-                else:
-                    single_pass(0)  # Loop forever
-
-            single_pass()
-
-        stop_button = ttk.Button(window, text="Stop Animation", command=stop)
+
+        stats_label = ttk.Label(window, text="")
+        stats_label.pack()
+        animator = CometAnimator(window, canvas, (x, y, z), prefix_line, line, 80, lod, duration, stats_label)
+
+        stop_button = ttk.Button(window, text="Stop Animation", command=animator.stop)
         stop_button.pack(pady=10)
 
-        window.after(0, animate)
+        animator.start()
+        return animator
 
     # Static 3D plot (green lines)
     def plot3d_static(self, x, y, z):
@@ -191,8 +363,9 @@ class AmplVisualization:
         plt.show()
 
     # Always show Top Tool and Bottom Tool overlay
-    def plot_top_bottom(self, x, y, u, v):
-        fig, axs = plt.subplots(1, 2, figsize=(12, 5))
+    # violations: optional boolean mask of moves where the tools clash (dual_tool)
+    def plot_top_bottom(self, x, y, u, v, violations=None):
+        fig, axs = plt.subplots(1, 2, figsize=(12, 5), sharex=True, sharey=True)
 
         axs[0].plot(x, y, 'm-')
         axs[0].set_title("Top Tool Path")
@@ -201,11 +374,23 @@ class AmplVisualization:
         axs[0].grid(True)
 
         axs[1].plot(u, v, 'c-')
+        # A parked bottom tool only shows as a point once the home moves are left out
+        u, v = np.asarray(u), np.asarray(v)
+        working = (u != 0) | (v != 0)
+        if working.any() and np.ptp(u[working]) == 0 and np.ptp(v[working]) == 0:
+            axs[1].plot(u[working][:1], v[working][:1], 'co', markersize=8, label="parked")
+            axs[1].legend()
         axs[1].set_title("Bottom Tool Path")
         axs[1].set_xlabel("U")
         axs[1].set_ylabel("V")
         axs[1].grid(True)
 
+        if violations is not None and np.any(violations):
+            axs[0].plot(np.asarray(x)[violations], np.asarray(y)[violations], 'rx', label="clearance")
+            axs[1].plot(u[violations], v[violations], 'rx', label="clearance")
+            axs[0].legend()
+            axs[1].legend()
+
         plt.tight_layout()
         plt.show()
 
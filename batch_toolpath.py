@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Headless batch G-code generation for parameter studies.
+
+A sweep spec lists texture jobs, either explicitly or as value lists whose
+cartesian product is taken. Every job runs cached_control_pairs ->
+reorder_control_points_dual -> write_Gcodes in a worker process.
+
+JSON / TOML spec:
+    {"output_dir": "sweep_out",
+     "sweep": {"loc": ["1", "2"], "sp": [0.5, 1.0], "angle": [0, 45],
+               "thinning_t": [0.2], "z_hold": [2.0],
+               "mode": ["one_direction", "zig_zag"], "direction": ["inward", "outward"]},
+     "jobs": [{"loc": "3", "sp": 0.25, "angle": 30, "thinning_t": 0.3, "z_hold": 2.0}]}
+
+"profile" (optional, also sweepable) names the machine profile of a job, see
+machine_profile; outputs for other than the default profile get its name appended.
+
+CSV spec: one job per row with the same column names; a cell may hold several
+values separated by ";" to sweep over them.
+
+Usage:
+    python batch_toolpath.py sweep.json [-o OUTPUT_DIR] [-j WORKERS] [--force]
+
+@author: kangputong
+"""
+
+import argparse
+import ast
+import csv
+import functools
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from texture_dual import Initializer, cached_control_pairs, reorder_control_points_dual, write_Gcodes
+from machine_profile import DEFAULT_PROFILE, get_profile, profile_tag
+
+try:
+    import tomllib
+except ImportError:     # Python < 3.11
+    tomllib = None
+
+FIELDS = ("loc", "sp", "angle", "thinning_t", "z_hold", "mode", "direction", "profile")
+DEFAULTS = {"mode": "one_direction", "direction": "inward", "profile": DEFAULT_PROFILE}
+FLOAT_FIELDS = ("sp", "angle", "thinning_t", "z_hold")
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Paths of the local modules a module's output depends on: the module itself and
+# every module of this folder it imports, directly or through another one
+@functools.lru_cache(maxsize=None)
+def source_files(module):
+    found, todo = [], [module]
+    while todo:
+        path = os.path.join(SOURCE_DIR, todo.pop() + ".py")
+        if path in found or not os.path.exists(path):
+            continue
+        found.append(path)
+        with open(path, 'r', encoding='utf-8') as file:
+            tree = ast.parse(file.read(), path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                todo += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                todo.append(node.module)
+    return tuple(sorted(found))
+
+# Turn one job dict (values may be lists) into concrete jobs
+def expand_job(spec):
+    spec = {**DEFAULTS, **spec}
+    missing = [name for name in FIELDS if name not in spec]
+    if missing:
+        raise ValueError(f"Job is missing {', '.join(missing)}: {spec}")
+    values = [spec[name] if isinstance(spec[name], list) else [spec[name]] for name in FIELDS]
+    for combo in itertools.product(*values):
+        job = dict(zip(FIELDS, combo))
+        job["loc"] = str(job["loc"])
+        for name in FLOAT_FIELDS:
+            job[name] = float(job[name])
+        yield job
+
+# Read a JSON / TOML / CSV spec file into a dict; CSV rows become "jobs"
+def read_spec(spec_path):
+    ext = os.path.splitext(spec_path)[1].lower()
+    if ext == ".csv":
+        with open(spec_path, newline='') as file:
+            rows = [{key.strip(): [v.strip() for v in value.split(";")]
+                     for key, value in row.items() if value and value.strip()}
+                    for row in csv.DictReader(file)]
+        return {"jobs": rows}
+    if ext == ".toml":
+        if tomllib is None:
+            raise RuntimeError("TOML specs need Python 3.11+ (tomllib)")
+        with open(spec_path, 'rb') as file:
+            return tomllib.load(file)
+    if ext == ".json":
+        with open(spec_path, 'r') as file:
+            return json.load(file)
+    raise ValueError(f"Unsupported spec format: {ext} (use .json, .toml or .csv)")
+
+# Read a JSON / TOML / CSV sweep spec into (output_dir, list of jobs)
+def load_spec(spec_path):
+    spec = read_spec(spec_path)
+    jobs = []
+    if "sweep" in spec:
+        jobs.extend(expand_job(spec["sweep"]))
+    for entry in spec.get("jobs", []):
+        jobs.extend(expand_job(entry))
+    return spec.get("output_dir"), jobs
+
+def geometry_key(job):
+    return job["loc"], job["angle"], job["sp"]
+
+def job_file_name(job):
+    return (f"texture_patch_loc{job['loc']}_{job['mode']}_{job['direction']}"
+            f"_sp{job['sp']:g}_a{job['angle']:g}_t{job['thinning_t']:g}_z{job['z_hold']:g}"
+            f"{profile_tag(job['profile'])}.txt")
+
+# An output is up to date when it is newer than the spec and the generator sources
+def is_up_to_date(path, newest_input):
+    return os.path.exists(path) and os.path.getmtime(path) >= newest_input
+
+# Worker: full pipeline for one job. write_Gcodes goes through GcodeWriter's temp
+# file, so a killed run never leaves a half-written program that looks up to date
+def run_job(job, path):
+    t = Initializer()
+    t.loc = job["loc"]
+    t.set_texture_bounds()
+    pairs = cached_control_pairs(t.ini_pt, t.fin_pt, job["angle"], job["sp"])
+    ordered_pts = reorder_control_points_dual(pairs, mode=job["mode"], direction=job["direction"])
+    write_Gcodes(ordered_pts, path, t.ini_pt, t.fin_pt, job["thinning_t"], job["z_hold"],
+                 profile=job["profile"])
+    return len(pairs), os.path.getsize(path)
+
+def run_batch(spec_path, output_dir=None, workers=None, force=False):
+    spec_dir, jobs = load_spec(spec_path)
+    output_dir = output_dir or spec_dir or "batch_output"
+    os.makedirs(output_dir, exist_ok=True)
+
+    profiles = [get_profile(name).path for name in {job["profile"] for job in jobs}]
+    newest_input = max(os.path.getmtime(p) for p in [spec_path, *source_files("batch_toolpath")] + profiles)
+    paths = [os.path.join(output_dir, job_file_name(job)) for job in jobs]
+    todo = [(job, path) for job, path in zip(jobs, paths)
+            if force or not is_up_to_date(path, newest_input)]
+    # Keep jobs with the same geometry together so each worker's pair cache gets reused
+    todo.sort(key=lambda item: geometry_key(item[0]))
+
+    start = time.perf_counter()
+    num_pairs = num_bytes = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for pairs, size in pool.map(run_job, *zip(*todo), chunksize=max(1, len(todo) // 64)):
+                num_pairs += pairs
+                num_bytes += size
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(jobs)} jobs: {len(todo)} written, {len(jobs) - len(todo)} up to date, in {elapsed:.2f} s")
+    if todo:
+        print(f"  {len(todo) / elapsed:.1f} files/s, {num_pairs / elapsed:,.0f} passes/s, "
+              f"{num_bytes / elapsed / 1e6:.1f} MB/s ({num_bytes / 1e6:.1f} MB total)")
+    print(f"  output folder: {output_dir}")
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate texture G-code for a parameter sweep.")
+    parser.add_argument("spec", help="sweep spec (.json, .toml or .csv)")
+    parser.add_argument("-o", "--output-dir", help="output folder (overrides the spec)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="rewrite outputs that are up to date")
+    args = parser.parse_args(argv)
+    run_batch(args.spec, args.output_dir, args.jobs, args.force)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the toolpath hot paths.
+
+The suite hatches a 50 mm patch with 10 .. 10^7 lines and, for every motion mode
+and direction, times each stage of the pipeline:
+  generate  generate_control_pairs (once per line count, uncached)
+  reorder   reorder_control_points_dual
+  write     write_Gcodes into a temporary folder
+  parse     parse_gcode on the written program (what AmplVisualization.parse_file does)
+  render    headless CometAnimator frames on an Agg canvas (per-frame times)
+Peak memory of every stage is taken from a separate tracemalloc run, so tracing
+does not distort the timings. Results are saved as JSON; against a baseline file,
+any stage slower than the threshold fails the run (exit status 1).
+
+Run directly:
+    python benchmark_toolpath.py -o bench.json
+    python benchmark_toolpath.py --sizes 10 1000 100000 --baseline bench.json --threshold 0.2
+    python benchmark_toolpath.py --clipping      # per-line loop vs batched clipper
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from texture_dual import (line_square_intersections, clip_lines_to_rectangle, texture_bounds,
+                          generate_control_pairs, reorder_control_points_dual, write_Gcodes)
+from gcode_parser import parse_gcode
+from ampl_visualization_GUI import CometAnimator
+
+DEFAULT_SIZES = tuple(10 ** k for k in range(1, 8))
+MODES = ("one_direction", "zig_zag")
+DIRECTIONS = ("inward", "outward", "travel")
+TRAVEL_MAX_LINES = 10 ** 5      # the travel sequencer has a Python loop per pass
+MIN_REPEAT_TIME = 0.2           # [s] small stages are repeated for at least this long
+MAX_REPEATS = 5
+RENDER_RUNS = 3                 # render runs take longer than MIN_REPEAT_TIME; the first warms up
+NOISE_FLOOR = 0.01              # [s] stages faster than this are never flagged
+ANGLE_DEG = 30.0
+THINNING_T = 0.2
+Z_HOLD = 2.0
+
+# Clip N hatch lines through a 50 mm square with the per-line solver (the old loop)
+def clip_per_line(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max):
+    intersections = []
+    for offset in offsets:
+        p0 = offset * normal_vec
+        points = line_square_intersections(p0, dir_vec, x_min, x_max, y_min, y_max)
+        if len(points) == 2:
+            intersections.append(points)
+    return intersections
+
+# Time the per-line loop against the batched clipper for growing line counts
+def bench_clipping(line_counts=(100, 1000, 10000, 100000), angle_deg=30.0, loop_limit=10000):
+    x_min, y_min, x_max, y_max = 37.5, 37.5, 87.5, 87.5
+    theta = math.radians(angle_deg)
+    dir_vec = np.array([np.cos(theta), np.sin(theta)])
+    normal_vec = np.array([-dir_vec[1], dir_vec[0]])
+    corners = np.array([[x_min, y_min], [x_min, y_max], [x_max, y_min], [x_max, y_max]])
+    projections = corners @ normal_vec
+    min_proj, max_proj = projections.min(), projections.max()
+
+    print(f"{'lines':>10} {'loop [s]':>12} {'batched [s]':>12} {'speed-up':>10}")
+    for n in line_counts:
+        offsets = np.linspace(min_proj, max_proj, n)
+
+        start = time.perf_counter()
+        batched = clip_lines_to_rectangle(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max)
+        t_batched = time.perf_counter() - start
+
+        # The scalar loop gets slow quickly, so only run it up to loop_limit lines
+        if n <= loop_limit:
+            start = time.perf_counter()
+            looped = clip_per_line(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max)
+            t_loop = time.perf_counter() - start
+            assert np.array_equal(np.array(looped).reshape(-1, 2, 2), batched)
+            print(f"{n:>10} {t_loop:>12.4f} {t_batched:>12.4f} {t_loop / t_batched:>9.1f}x")
+        else:
+            print(f"{n:>10} {'-':>12} {t_batched:>12.4f} {'-':>10}")
+
+# Spacing that gives about num_lines hatch lines across the patch at angle_deg
+def spacing_for(num_lines, ini_pt, fin_pt, angle_deg=ANGLE_DEG):
+    theta = math.radians(angle_deg)
+    width, height = abs(fin_pt[0] - ini_pt[0]), abs(fin_pt[1] - ini_pt[1])
+    return (width * abs(math.sin(theta)) + height * abs(math.cos(theta))) / num_lines
+
+# Best-of wall time, repeating fast stages; returns (seconds, last result)
+def time_stage(fn, min_runs=1):
+    best, spent, runs = math.inf, 0.0, 0
+    while runs < max(min_runs, MAX_REPEATS) and (runs < min_runs or spent < MIN_REPEAT_TIME):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best, spent, runs = min(best, elapsed), spent + elapsed, runs + 1
+    return best, result
+
+# Peak traced allocation of one run [MB]
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+# Stand-in for the Tk window CometAnimator schedules on; frames are driven directly
+class HeadlessWindow:
+    def protocol(self, name, func):
+        pass
+
+    def after(self, delay, func):
+        pass
+
+    def destroy(self):
+        pass
+
+# Per-frame render times [ms] of one comet pass on an Agg canvas
+def render_frames(x, y):
+    fig = Figure()
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.set_xlim(np.min(x) - 5, np.max(x) + 5)
+    ax.set_ylim(np.min(y) - 5, np.max(y) + 5)
+    ax.grid(True)
+    prefix_line, = ax.plot([], [], 'b-')
+    line, = ax.plot([], [], 'b-')
+    # LOD playback keeps the frame count fixed (LOD_DURATION at 50 ms) at every size
+    animator = CometAnimator(HeadlessWindow(), canvas, (x, y), prefix_line, line, 50, lod=True)
+    animator._restart()
+    times = []
+    for frame in range(animator.frame + 1, len(animator.frame_ends)):
+        start = time.perf_counter()
+        animator._draw_frame(frame)
+        times.append(1000 * (time.perf_counter() - start))
+    return np.array(times)
+
+def _record(results, num_lines, mode, direction, stage, seconds, peak_mb, **extra):
+    entry = {"lines": num_lines, "mode": mode, "direction": direction, "stage": stage,
+             "seconds": seconds, "peak_mb": peak_mb, **extra}
+    results.append(entry)
+    label = f"{mode}/{direction}" if mode else "-"
+    print(f"{num_lines:>10} {label:>24} {stage:>9} {seconds:>10.4f} {peak_mb:>10.1f}"
+          + "".join(f"  {k}={v:.3g}" for k, v in extra.items()))
+
+def run_suite(sizes=DEFAULT_SIZES, modes=MODES, directions=DIRECTIONS, memory=True, render=True):
+    ini_pt, fin_pt = texture_bounds("1")
+    results = []
+    print(f"{'lines':>10} {'mode/direction':>24} {'stage':>9} {'time [s]':>10} {'peak [MB]':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench.txt")
+        for num_lines in sizes:
+            sp = spacing_for(num_lines, ini_pt, fin_pt)
+            gen = lambda: generate_control_pairs(ini_pt, fin_pt, ANGLE_DEG, sp)
+            seconds, pairs = time_stage(gen)
+            _record(results, num_lines, None, None, "generate", seconds,
+                    peak_memory(gen) if memory else 0.0, passes=len(pairs))
+
+            for mode, direction in itertools.product(modes, directions):
+                if direction == "travel" and num_lines > TRAVEL_MAX_LINES:
+                    continue
+                reorder = lambda: reorder_control_points_dual(pairs, mode=mode, direction=direction)
+                seconds, ordered_pts = time_stage(reorder)
+                _record(results, num_lines, mode, direction, "reorder", seconds,
+                        peak_memory(reorder) if memory else 0.0)
+
+                write = lambda: write_Gcodes(ordered_pts, path, ini_pt, fin_pt, THINNING_T, Z_HOLD)
+                seconds, _ = time_stage(write)
+                size_mb = os.path.getsize(path) / 1e6
+                _record(results, num_lines, mode, direction, "write", seconds,
+                        peak_memory(write) if memory else 0.0, mb_per_s=size_mb / seconds)
+
+                parse = lambda: parse_gcode(path)
+                seconds, data = time_stage(parse)
+                _record(results, num_lines, mode, direction, "parse", seconds,
+                        peak_memory(parse) if memory else 0.0, mb_per_s=size_mb / seconds)
+
+                if render:
+                    seconds, frame_ms = time_stage(lambda: render_frames(data[0], data[1]), RENDER_RUNS)
+                    _record(results, num_lines, mode, direction, "render", seconds,
+                            0.0, frames=len(frame_ms), mean_ms=float(frame_ms.mean()),
+                            p95_ms=float(np.percentile(frame_ms, 95)), max_ms=float(frame_ms.max()))
+    return results
+
+def save_results(results, file_path):
+    meta = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+    with open(file_path, 'w') as file:
+        json.dump({"meta": meta, "results": results}, file, indent=1)
+
+def _key(entry):
+    return entry["lines"], entry["mode"], entry["direction"], entry["stage"]
+
+# Stages that got slower than baseline * (1 + threshold); returns a list of messages
+def compare_results(results, baseline_path, threshold=0.2):
+    with open(baseline_path, 'r') as file:
+        baseline = {_key(entry): entry for entry in json.load(file)["results"]}
+    regressions = []
+    for entry in results:
+        old = baseline.get(_key(entry))
+        if old is None or max(old["seconds"], entry["seconds"]) < NOISE_FLOOR:
+            continue
+        ratio = entry["seconds"] / old["seconds"] if old["seconds"] > 0 else math.inf
+        if ratio > 1 + threshold:
+            lines, mode, direction, stage = _key(entry)
+            regressions.append(f"{stage} at {lines} lines ({mode}/{direction}): "
+                               f"{old['seconds']:.4f} s -> {entry['seconds']:.4f} s ({ratio:.2f}x)")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the toolpath pipeline stages.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="hatch line counts")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--directions", nargs="+", default=list(DIRECTIONS), choices=DIRECTIONS)
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="results file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--no-render", action="store_true", help="skip the headless render stage")
+    parser.add_argument("--clipping", action="store_true", help="only run the clipping loop comparison")
+    args = parser.parse_args(argv)
+
+    if args.clipping:
+        bench_clipping()
+        return 0
+    results = run_suite(args.sizes, args.modes, args.directions, not args.no_memory, not args.no_render)
+    save_results(results, args.output)
+    print(f"Results saved to: {args.output}")
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, args.threshold)
+        for message in regressions:
+            print("REGRESSION", message)
+        if regressions:
+            return 1
+        print(f"No stage slower than {args.threshold:.0%} over the baseline")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Out-of-core texture programs: generation, ordering, writing and verification in
+fixed-size chunks of passes.
+
+write_Gcodes needs every control point in memory (the hatch lines, the ordered
+points, the move blocks). Here no step holds more than one chunk of passes:
+  generate  the hatch lines are addressed by pass index; a first sweep over the
+            lines (chunk by chunk) only records the few lines the clipping drops,
+            so pass k maps to its line without a table of all passes
+  order     inward / outward positions are computed from the position alone
+            (pass_order_slice), so chunk i of the sequence is built directly
+  write     moves are expanded per chunk (with the jog into the next chunk) and
+            streamed through section_lines and GcodeWriter
+  verify    the written file is parsed chunk by chunk (iter_gcode_blocks) and
+            compared with the regenerated moves, again chunk by chunk
+Memory therefore depends on chunk_passes, not on the program size. The chunk is a
+multiple of DEFAULT_CHUNK_PAIRS, so moves are blocked (and point-reduced) exactly
+as in write_Gcodes and the program is byte-identical to it.
+
+"travel" ordering needs all passes at once and is not available here.
+
+Usage:
+    python chunked_pipeline.py -l 1 -a 0 -s 0.002 -t 0.2 -z 2 -o big.txt [--verify]
+                               [--mode zig_zag] [--direction outward] [--tol 0.01]
+                               [--chunk-passes 65536] [--profile NAME]
+
+@author: kangputong
+"""
+
+import argparse
+import copy
+import math
+import time
+import numpy as np
+from gcode_writer import DEFAULT_CHUNK_PAIRS, GcodeWriter, toolpath_moves
+from gcode_parser import DEFAULT_CHUNK_SIZE, iter_gcode_blocks
+from machine_profile import get_profile
+from point_reduction import reduce_move_blocks, new_reduction_stats
+from texture_dual import (texture_bounds, clip_lines_to_rectangle, clipped_line_mask, pass_order_slice,
+                          orient_passes, section_lines)
+
+DEFAULT_CHUNK_PASSES = 8 * DEFAULT_CHUNK_PAIRS    # ~260k moves, ~20 MB of text per chunk
+ROUNDING_SLACK = 1e-9                             # float error on top of the rounding
+
+# Largest difference between a value and its written form at a profile's precision
+def write_tolerance(profile=None):
+    return get_profile(profile).resolution / 2 + ROUNDING_SLACK
+
+# Chunk size rounded up to whole write_Gcodes move blocks
+def chunk_size_for(chunk_passes):
+    return max(1, math.ceil(chunk_passes / DEFAULT_CHUNK_PAIRS)) * DEFAULT_CHUNK_PAIRS
+
+# The hatch lines of generate_control_pairs, addressed by pass index
+class HatchLines:
+    def __init__(self, ini_pt, fin_pt, angle_deg, sp, chunk_passes=DEFAULT_CHUNK_PASSES):
+        theta = math.radians(angle_deg)
+        self.dir_vec = np.array([np.cos(theta), np.sin(theta)])
+        self.normal_vec = np.array([-self.dir_vec[1], self.dir_vec[0]])
+        self.bounds = (min(ini_pt[0], fin_pt[0]), max(ini_pt[0], fin_pt[0]),
+                       min(ini_pt[1], fin_pt[1]), max(ini_pt[1], fin_pt[1]))
+        x_min, x_max, y_min, y_max = self.bounds
+        corners = np.array([[x_min, y_min], [x_min, y_max], [x_max, y_min], [x_max, y_max]])
+        projections = corners @ self.normal_vec
+        self.min_proj = projections.min()
+        self.sp = sp
+        self.num_lines = int((projections.max() - self.min_proj) / sp) + 1
+
+        # Lines without exactly two edge hits (corner touches) are not passes
+        dropped = []
+        for start in range(0, self.num_lines, chunk_passes):
+            lines = np.arange(start, min(start + chunk_passes, self.num_lines))
+            keep = clipped_line_mask(self.offsets(lines), self.dir_vec, self.normal_vec, *self.bounds)
+            dropped.extend(lines[~keep].tolist())
+        # Pass k is line k + (number of dropped lines at or before it)
+        self._skips = np.array(dropped, dtype=np.intp) - np.arange(len(dropped))
+        self.num_passes = self.num_lines - len(dropped)
+
+    def offsets(self, lines):
+        return self.min_proj + lines * self.sp
+
+    def line_index(self, passes):
+        return passes + np.searchsorted(self._skips, passes, side='right')
+
+    # (n, 2, 2) endpoint pairs of the given passes, as in generate_control_pairs
+    def pairs(self, passes):
+        return clip_lines_to_rectangle(self.offsets(self.line_index(np.asarray(passes))),
+                                       self.dir_vec, self.normal_vec, *self.bounds)
+
+# One texture program, produced and checked chunk by chunk
+class ChunkedProgram:
+    def __init__(self, ini_pt, fin_pt, angle, sp, thinning_t, z_hold, mode="one_direction", direction="inward",
+                 tolerance=None, bottom_tool=None, chunk_passes=DEFAULT_CHUNK_PASSES, profile=None):
+        if direction not in ("inward", "outward"):
+            raise ValueError("Chunked programs need 'inward' or 'outward' order "
+                             "('travel' needs every pass in memory)")
+        self.ini_pt, self.fin_pt = ini_pt, fin_pt
+        self.thinning_t = thinning_t
+        self.z_hold = z_hold
+        self.mode = mode
+        self.direction = direction
+        self.tolerance = tolerance
+        self.bottom_tool = bottom_tool
+        self.profile = get_profile(profile)
+        self.chunk_passes = chunk_size_for(chunk_passes)
+        self.hatch = HatchLines(ini_pt, fin_pt, angle, sp, self.chunk_passes)
+        if self.hatch.num_passes == 0:
+            raise ValueError(f"No passes at spacing {sp:g} mm")
+
+    @classmethod
+    def at_location(cls, loc, *args, **kwargs):
+        ini_pt, fin_pt = texture_bounds(loc)
+        return cls(ini_pt, fin_pt, *args, **kwargs)
+
+    @property
+    def num_moves(self):
+        return 4 * self.hatch.num_passes - 2
+
+    # Ordered control points, (2k, 2) per chunk
+    def point_chunks(self):
+        n = self.hatch.num_passes
+        for start in range(0, n, self.chunk_passes):
+            order = pass_order_slice(n, self.direction, start, start + self.chunk_passes)
+            yield orient_passes(self.hatch.pairs(order), self.mode, start).reshape(-1, 2)
+
+    def first_point(self):
+        order = pass_order_slice(self.hatch.num_passes, self.direction, 0, 1)
+        return orient_passes(self.hatch.pairs(order), self.mode)[0, 0]
+
+    # (n, 3) move blocks; each chunk also gets the jog into the next one
+    def move_blocks(self):
+        chunks = self.point_chunks()
+        current = next(chunks, None)
+        while current is not None:
+            following = next(chunks, None)
+            next_pt = None if following is None else following[0]
+            yield from toolpath_moves(current, self.thinning_t, self.z_hold, next_pt=next_pt)
+            current = following
+
+    # Same contract as write_Gcodes: reduction stats with a tolerance, else None
+    def write(self, file_path, progress=None):
+        stats = new_reduction_stats() if self.tolerance is not None else None
+        with GcodeWriter(file_path) as writer:
+            writer.write_lines([self.profile.program_start])
+            writer.write_lines(section_lines(self.first_point(), self.move_blocks(), self.num_moves,
+                                             self.ini_pt, self.fin_pt, self.tolerance, stats, progress,
+                                             self.bottom_tool, self.profile))
+            writer.write_lines([self.profile.footer])
+        return stats
+
+    # The (6, n) X, Y, Z, U, V, W blocks the program should contain
+    def expected_columns(self):
+        center_x = (self.ini_pt[0] + self.fin_pt[0]) / 2
+        center_y = (self.ini_pt[1] + self.fin_pt[1]) / 2
+        # A copy, so the clearance report of the write is kept
+        bottom_tool = copy.deepcopy(self.bottom_tool)
+        first_pt = self.first_point()
+        approach = (center_x, center_y) if bottom_tool is None else bottom_tool.start(first_pt)
+        profile = self.profile
+        yield np.array(profile.home)[:, None]
+        yield np.array([first_pt[0], first_pt[1], profile.approach_z, approach[0], approach[1],
+                        profile.approach_w])[:, None]
+        blocks = self.move_blocks()
+        if self.tolerance is not None:
+            blocks = reduce_move_blocks(blocks, self.tolerance)
+        for xyz in blocks:
+            if bottom_tool is None:
+                uvw = np.broadcast_to((center_x, center_y, profile.park_w), xyz.shape)
+            else:
+                uvw = bottom_tool.follow(xyz)
+            yield np.hstack([xyz, uvw]).T
+        yield np.array(profile.home)[:, None]
+
+    # Parse file_path chunk by chunk and compare every move with expected_columns
+    def verify(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        return compare_columns(iter_gcode_blocks(file_path, chunk_size), self.expected_columns(),
+                               write_tolerance(self.profile))
+
+def new_verification_report():
+    return {"moves": 0, "expected": 0, "max_deviation": 0.0, "first_mismatch": None, "ok": True}
+
+# Compare two streams of (6, n) blocks row by row, whatever their block sizes
+def compare_columns(found_blocks, expected_blocks, tolerance=None):
+    if tolerance is None:
+        tolerance = write_tolerance()
+    report = new_verification_report()
+    expected_blocks = iter(expected_blocks)
+    pending = np.empty((6, 0))
+
+    def mismatch(move, expected, found):
+        if report["first_mismatch"] is None:
+            report["first_mismatch"] = {"move": move, "expected": expected, "found": found}
+
+    for found in found_blocks:
+        pos = 0
+        while pos < found.shape[1]:
+            if pending.shape[1] == 0:
+                pending = next(expected_blocks, None)
+                if pending is None:
+                    # More moves in the file than expected
+                    mismatch(report["moves"], None, found[:, pos].tolist())
+                    report["moves"] += found.shape[1] - pos
+                    pending = np.empty((6, 0))
+                    break
+                report["expected"] += pending.shape[1]
+                continue
+            n = min(pending.shape[1], found.shape[1] - pos)
+            deviation = np.abs(found[:, pos:pos + n] - pending[:, :n])
+            worst = deviation.max(axis=0)
+            report["max_deviation"] = max(report["max_deviation"], float(worst.max()))
+            bad = worst > tolerance
+            if bad.any():
+                k = int(np.argmax(bad))
+                mismatch(report["moves"] + k, pending[:, k].tolist(), found[:, pos + k].tolist())
+            report["moves"] += n
+            pending = pending[:, n:]
+            pos += n
+    for block in expected_blocks:
+        report["expected"] += block.shape[1]
+    if report["moves"] < report["expected"]:
+        mismatch(report["moves"], pending[:, 0].tolist() if pending.shape[1] else None, None)
+    report["ok"] = report["first_mismatch"] is None
+    return report
+
+def format_verification(report):
+    if report["ok"]:
+        return (f"Verified: {report['moves']:,} moves match "
+                f"(max deviation {report['max_deviation']:.1e} mm)")
+    first = report["first_mismatch"]
+    return (f"Verification failed: {report['moves']:,} moves, {report['expected']:,} expected; "
+            f"first mismatch at move {first['move']:,} (expected {first['expected']}, found {first['found']})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write (and verify) a texture program in fixed-size chunks.")
+    parser.add_argument("-l", "--loc", required=True, choices=["1", "2", "3", "4"], help="patch location")
+    parser.add_argument("-a", "--angle", type=float, required=True, help="hatch angle [deg]")
+    parser.add_argument("-s", "--sp", type=float, required=True, help="spacing [mm]")
+    parser.add_argument("-t", "--thinning", type=float, required=True, help="thinning from the top [mm]")
+    parser.add_argument("-z", "--z-hold", type=float, required=True, help="jog height [mm]")
+    parser.add_argument("-o", "--output", required=True, help="program file")
+    parser.add_argument("--mode", default="one_direction", choices=["one_direction", "zig_zag"])
+    parser.add_argument("--direction", default="inward", choices=["inward", "outward"])
+    parser.add_argument("--tol", type=float, default=None, help="point reduction tolerance [mm]")
+    parser.add_argument("--chunk-passes", type=int, default=DEFAULT_CHUNK_PASSES,
+                        help=f"passes held in memory at once (multiple of {DEFAULT_CHUNK_PAIRS})")
+    parser.add_argument("--profile", default=None, help="machine profile name or file")
+    parser.add_argument("--verify", action="store_true", help="parse the written file back and compare")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    program = ChunkedProgram.at_location(args.loc, args.angle, args.sp, args.thinning, args.z_hold, args.mode,
+                                         args.direction, args.tol, chunk_passes=args.chunk_passes,
+                                         profile=args.profile)
+    print(f"{program.hatch.num_passes:,} passes, {program.num_moves:,} moves, "
+          f"{program.chunk_passes:,} passes per chunk")
+    program.write(args.output)
+    print(f"Written to {args.output} in {time.perf_counter() - start:.1f} s")
+    if args.verify:
+        start = time.perf_counter()
+        report = program.verify(args.output)
+        print(f"{format_verification(report)} in {time.perf_counter() - start:.1f} s")
+        if not report["ok"]:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
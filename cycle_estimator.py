@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Cycle-time and motion statistics for a toolpath, computed from the move arrays.
+
+Motion model (matches the program header of the machine profile, the default one
+unless a profile is given):
+  - feed F is the vector speed of the feedrate axes FRAX(X,Y,Z) in mm/s
+  - every move accelerates and decelerates over TA + TS ms (trapezoid, the S-curve
+    time TS is added to the ramp), and moves are not blended, so the estimate is
+    on the conservative side
+  - U/V/W are not feedrate axes and finish inside the X/Y/Z move time
+  - the top tool is in the sheet while Z <= 0: moves that stay there are cutting
+    moves, everything else is air time
+
+@author: kangputong
+"""
+
+import numpy as np
+from gcode_writer import toolpath_moves
+from machine_profile import get_profile
+
+AXES = ("X", "Y", "Z", "U", "V", "W")
+
+# Feed F [mm/s], TA and TS [ms] of a machine profile, unless given explicitly
+def motion_params(profile=None, feed=None, ta_ms=None, ts_ms=None):
+    machine = get_profile(profile)
+    return (machine.feed if feed is None else feed,
+            float(machine.accel_ms) if ta_ms is None else ta_ms,
+            float(machine.scurve_ms) if ts_ms is None else ts_ms)
+
+# Trapezoidal move time for each path length: ramps of accel_time [s] at both ends,
+# triangular profile when the move is too short to reach the feed
+def move_times(lengths, feed=None, accel_time=None, profile=None):
+    feed, ta_ms, ts_ms = motion_params(profile, feed)
+    if accel_time is None:
+        accel_time = (ta_ms + ts_ms) / 1000
+    lengths = np.asarray(lengths, dtype=float)
+    accel = feed / accel_time
+    full = lengths >= feed * accel_time
+    times = np.where(full, lengths / feed + accel_time, 2.0 * np.sqrt(lengths / accel))
+    return np.where(lengths > 0, times, 0.0)
+
+# Statistics for consecutive positions x, y, z (and optionally u, v, w)
+def estimate_cycle_time(x, y, z, u=None, v=None, w=None, feed=None, ta_ms=None, ts_ms=None, profile=None):
+    feed, ta_ms, ts_ms = motion_params(profile, feed, ta_ms, ts_ms)
+    coords = [np.asarray(c, dtype=float) for c in (x, y, z, u, v, w) if c is not None]
+    deltas = [np.diff(c) for c in coords]
+    lengths = np.sqrt(deltas[0] ** 2 + deltas[1] ** 2 + deltas[2] ** 2)
+    times = move_times(lengths, feed, (ta_ms + ts_ms) / 1000)
+
+    in_sheet = coords[2] <= 0
+    cutting = in_sheet[:-1] & in_sheet[1:]
+    retracts = in_sheet[:-1] & ~in_sheet[1:]
+    plunges = ~in_sheet[:-1] & in_sheet[1:]
+    air = ~cutting
+    jogs = ~in_sheet[:-1] & ~in_sheet[1:]
+
+    per_axis = {}
+    for name, d in zip(AXES, deltas):
+        moving = d != 0
+        per_axis[name] = {"distance_mm": float(np.abs(d).sum()), "busy_s": float(times[moving].sum())}
+
+    return {
+        "moves": int(len(lengths)),
+        "cutting_mm": float(lengths[cutting].sum()),
+        "air_mm": float(lengths[air].sum()),
+        "jog_mm": float(np.hypot(deltas[0], deltas[1])[jogs].sum()),
+        "retracts": int(retracts.sum()),
+        "plunges": int(plunges.sum()),
+        "cutting_s": float(times[cutting].sum()),
+        "air_s": float(times[air].sum()),
+        "cycle_s": float(times.sum()),
+        "per_axis": per_axis,
+    }
+
+# Same statistics straight from ordered control points, following the moves
+# write_Gcodes emits for the profile (home, approach, passes, home) without writing a file
+def estimate_from_points(control_pts, thinning_t, z_hold, feed=None, ta_ms=None, ts_ms=None, profile=None):
+    machine = get_profile(profile)
+    home = machine.home[:3]
+    control_pts = np.asarray(control_pts, dtype=float).reshape(-1, 2)
+    approach = [[home], [[control_pts[0][0], control_pts[0][1], machine.approach_z]]]
+    blocks = approach + list(toolpath_moves(control_pts, thinning_t, z_hold)) + [[home]]
+    xyz = np.concatenate([np.asarray(b, dtype=float).reshape(-1, 3) for b in blocks])
+    return estimate_cycle_time(xyz[:, 0], xyz[:, 1], xyz[:, 2], feed=feed, ta_ms=ta_ms, ts_ms=ts_ms,
+                               profile=machine)
+
+def format_duration(seconds):
+    minutes, sec = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{sec:02d}"
+
+# Short multi-line summary for the GUI / console
+def format_estimate(stats):
+    return (f"Cycle time: {format_duration(stats['cycle_s'])} "
+            f"(cut {format_duration(stats['cutting_s'])}, air {format_duration(stats['air_s'])})\n"
+            f"Cutting: {stats['cutting_mm'] / 1000:.2f} m, air: {stats['air_mm'] / 1000:.2f} m "
+            f"(jog {stats['jog_mm'] / 1000:.2f} m)\n"
+            f"Moves: {stats['moves']:,}, retracts: {stats['retracts']:,}")
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Bottom tool (U, V, W) trajectories for two-sided forming.
+
+By default write_Gcodes parks the bottom tool at the patch centre (U cx, V cy,
+W 0). A BottomTool instead computes the bottom tool position for every top tool
+move, block by block, with whole-array operations:
+  park       U cx, V cy, W 0 (the single-tool programs, no clearance check)
+  mirrored   point mirror of the top tool through the patch centre and the sheet
+             plane: U = 2 cx - X, V = 2 cy - Y, W = -Z
+  following  under the top tool, shifted by offset in XY and gap below it:
+             U = X + dx, V = Y + dy, W = min(Z, 0) - gap
+  lagged     like following, but at the top tool position `lag` mm back along the
+             path (XY arc length, so plunges and retracts do not advance it);
+             W stays gap below both that position and the current top tool
+The lag state is carried from block to block, so the trajectory does not depend
+on how the moves are chunked.
+
+Each block is also checked for clearance: wherever the tools come within `reach`
+of each other in XY (sum of the tool radii), the top tip must stay at least `gap`
+above the bottom tip. Both tools move linearly between lines, so every segment
+is checked at its ends and at the closest XY approach of the two tools.
+Violations are collected in bottom_tool.clearance; with strict=True the first
+one raises ClearanceError (and a write through GcodeWriter leaves no file).
+
+@author: kangputong
+"""
+
+import math
+import numpy as np
+
+STRATEGIES = ("park", "mirrored", "following", "lagged")
+DEFAULT_GAP = 0.5           # [mm] sheet thickness kept between the tool tips
+DEFAULT_REACH = 10.0        # [mm] top + bottom tool radius
+DEFAULT_LAG = 12.0          # [mm] path length the lagged tool trails by
+GAP_SLACK = 1e-9            # decimal values are not exact in binary
+
+class ClearanceError(ValueError):
+    pass
+
+def new_clearance_report():
+    return {"checked": 0, "violations": 0, "min_gap": math.inf, "first_violation": None}
+
+# Boolean mask of segment ends (rows 1..) where the tools clash, and the smallest
+# vertical gap while they are within reach. top / bottom are (n, 3) with the
+# previous move as the first row.
+def clearance_violations(top, bottom, gap=DEFAULT_GAP, reach=DEFAULT_REACH):
+    d0 = top[:-1, :2] - bottom[:-1, :2]
+    d1 = top[1:, :2] - bottom[1:, :2]
+    g0 = top[:-1, 2] - bottom[:-1, 2]
+    g1 = top[1:, 2] - bottom[1:, 2]
+    step = d1 - d0
+    length2 = np.einsum('ij,ij->i', step, step)
+    t = np.clip(-np.einsum('ij,ij->i', d0, step) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+    t = np.where(length2 > 0, t, 0.0)
+
+    bad = np.zeros(len(t), dtype=bool)
+    min_gap = math.inf
+    for where in (np.zeros_like(t), t, np.ones_like(t)):
+        d = d0 + where[:, None] * step
+        g = g0 + where * (g1 - g0)
+        close = np.einsum('ij,ij->i', d, d) < reach * reach
+        if close.any():
+            min_gap = min(min_gap, float(g[close].min()))
+        bad |= close & (g < gap - GAP_SLACK)
+    return bad, min_gap
+
+# Per-move mask for plotting: True where the segment ending at that move clashes
+def violation_mask(top, bottom, gap=DEFAULT_GAP, reach=DEFAULT_REACH):
+    if len(top) < 2:
+        return np.zeros(len(top), dtype=bool)
+    bad, _ = clearance_violations(np.asarray(top, dtype=float), np.asarray(bottom, dtype=float), gap, reach)
+    return np.concatenate([[False], bad])
+
+class BottomTool:
+    def __init__(self, strategy="following", center=(0.0, 0.0), gap=DEFAULT_GAP, offset=(0.0, 0.0),
+                 lag=DEFAULT_LAG, reach=DEFAULT_REACH, strict=False):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown bottom tool strategy: {strategy} (use {', '.join(STRATEGIES)})")
+        self.strategy = strategy
+        self.center = np.asarray(center, dtype=float)
+        self.gap = gap
+        self.offset = np.asarray(offset, dtype=float)
+        self.lag = lag if strategy == "lagged" else 0.0
+        self.reach = reach
+        self.strict = strict
+        self.reset()
+
+    @classmethod
+    def for_patch(cls, strategy, ini_pt, fin_pt, **kwargs):
+        center = ((ini_pt[0] + fin_pt[0]) / 2, (ini_pt[1] + fin_pt[1]) / 2)
+        return cls(strategy, center, **kwargs)
+
+    def reset(self):
+        self.clearance = new_clearance_report()
+        self.moves = 0
+        self._last = None           # last top / bottom move, for segments across blocks
+        self._tail_s = None         # recent path (arc length, points) for the lag
+        self._tail_p = None
+
+    # Start a new section at the first control point; returns the bottom U, V there
+    def start(self, first_pt):
+        self.reset()
+        xyz = np.array([[first_pt[0], first_pt[1], 0.0]])
+        if self.strategy == "lagged":
+            self._tail_s, self._tail_p = np.zeros(1), xyz
+        return tuple(self._position(xyz, xyz)[0, :2].tolist())
+
+    def _position(self, xyz, source):
+        if self.strategy == "park":
+            return np.broadcast_to(np.array([*self.center, 0.0]), xyz.shape).copy()
+        uvw = np.empty_like(xyz)
+        if self.strategy == "mirrored":
+            uvw[:, :2] = 2 * self.center - xyz[:, :2]
+            uvw[:, 2] = -xyz[:, 2]
+        else:
+            uvw[:, :2] = source[:, :2] + self.offset
+            uvw[:, 2] = np.minimum(np.minimum(source[:, 2], xyz[:, 2]), 0.0) - self.gap
+        return uvw
+
+    # Top tool positions `lag` mm of XY path before each move
+    def _lagged_source(self, xyz):
+        if self._tail_p is None:
+            self._tail_s, self._tail_p = np.zeros(1), xyz[:1]
+        steps = np.diff(np.concatenate([self._tail_p[-1:], xyz])[:, :2], axis=0)
+        s_new = self._tail_s[-1] + np.cumsum(np.hypot(steps[:, 0], steps[:, 1]))
+        s = np.concatenate([self._tail_s, s_new])
+        pts = np.concatenate([self._tail_p, xyz])
+        target = np.maximum(s_new - self.lag, s[0])
+        i = np.clip(np.searchsorted(s, target, side='right') - 1, 0, len(s) - 2)
+        ds = s[i + 1] - s[i]
+        frac = np.where(ds > 0, (target - s[i]) / np.where(ds > 0, ds, 1.0), 0.0)
+        source = pts[i] + frac[:, None] * (pts[i + 1] - pts[i])
+        # Keep just enough path for the next block
+        keep = max(int(np.searchsorted(s, s[-1] - self.lag, side='right')) - 1, 0)
+        self._tail_s, self._tail_p = s[keep:], pts[keep:]
+        return source
+
+    # Bottom tool (n, 3) U, V, W for a block of top tool (n, 3) X, Y, Z moves
+    def follow(self, xyz):
+        xyz = np.asarray(xyz, dtype=float)
+        if len(xyz) == 0:
+            return np.empty((0, 3))
+        source = self._lagged_source(xyz) if self.strategy == "lagged" else xyz
+        uvw = self._position(xyz, source)
+        if self.strategy != "park":
+            self._check(xyz, uvw)
+        self.moves += len(xyz)
+        return uvw
+
+    def _check(self, xyz, uvw):
+        # Row k of top / bottom is move self.moves + k - shift
+        if self._last is None:
+            top, bottom, shift = xyz, uvw, 0
+        else:
+            top, bottom, shift = np.vstack([self._last[0], xyz]), np.vstack([self._last[1], uvw]), 1
+        self._last = (xyz[-1:], uvw[-1:])
+        if len(top) < 2:
+            return
+        bad, min_gap = clearance_violations(top, bottom, self.gap, self.reach)
+        report = self.clearance
+        report["checked"] += len(bad)
+        report["min_gap"] = min(report["min_gap"], min_gap)
+        count = int(bad.sum())
+        if count:
+            report["violations"] += count
+            if report["first_violation"] is None:
+                k = int(np.argmax(bad)) + 1
+                report["first_violation"] = {"move": self.moves + k - shift,
+                                             "top": top[k].tolist(), "bottom": bottom[k].tolist()}
+                if self.strict:
+                    raise ClearanceError(format_clearance(report))
+
+def format_clearance(report):
+    if report["checked"] == 0:
+        return "Clearance: not checked"
+    gap = "-" if math.isinf(report["min_gap"]) else f"{report['min_gap']:.3f} mm"
+    if not report["violations"]:
+        return f"Clearance: OK ({report['checked']:,} segments, min gap within reach {gap})"
+    first = report["first_violation"]
+    return (f"Clearance: {report['violations']:,} of {report['checked']:,} segments too close "
+            f"(min gap {gap}), first at move {first['move']:,}: "
+            f"top Z {first['top'][2]:.3f}, bottom W {first['bottom'][2]:.3f}")
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar G-code parser used by AmplVisualization.parse_file.
+
+The file is read in large byte chunks cut at line boundaries. Chunks where every
+motion line has the usual "X .. Y .. Z .. U .. V .. W .. [F ..]" layout go through
+numpy's C tokenizer in one call; any other chunk falls back to the line-by-line
+rules of the original parser, so the result is the same either way:
+  - only lines starting with "X" are read
+  - a line is kept only if it has both X and Y
+  - missing axes default to 0
+
+@author: kangputong
+"""
+
+import mmap
+import re
+import tempfile
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 16 << 20   # bytes per read
+AXES = ("X", "Y", "Z", "U", "V", "W")
+
+_MOTION_LINE = re.compile(rb"^X[^\n]*", re.M)
+_CANONICAL_LINE = re.compile(rb"^X \S+ Y \S+ Z \S+ U \S+ V \S+ W \S+(?: F \S+)?[ \t\r]*$", re.M)
+
+# Yield byte chunks of the file, each ending on a complete line
+# (offset, if given, must be the start of a line)
+def iter_text_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE, use_mmap=False, offset=0):
+    with open(file_path, 'rb') as file:
+        if use_mmap:
+            size = file.seek(0, 2)
+            if size <= offset:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = offset
+                while start < size:
+                    stop = min(start + chunk_size, size)
+                    if stop < size:
+                        cut = mm.rfind(b"\n", start, stop)
+                        stop = cut + 1 if cut >= start else (mm.find(b"\n", stop) + 1 or size)
+                    yield mm[start:stop]
+                    start = stop
+        else:
+            file.seek(offset)
+            carry = b""
+            while True:
+                data = file.read(chunk_size)
+                if not data:
+                    break
+                data = carry + data
+                cut = data.rfind(b"\n") + 1
+                carry = data[cut:]
+                if cut:
+                    yield data[:cut]
+            if carry:
+                yield carry
+
+# Old per-line rules, used for chunks with unusual lines
+def _parse_line(line):
+    parts = line.decode().strip().split()
+    variables = {}
+    for i in range(0, len(parts), 2):
+        variables[parts[i]] = float(parts[i + 1])
+    if "X" in variables and "Y" in variables:
+        return [variables.get(axis, 0.0) for axis in AXES]
+    return None
+
+# Parse one chunk into a (6, n) block of X, Y, Z, U, V, W
+def parse_block(text):
+    lines = _MOTION_LINE.findall(text)
+    if not lines:
+        return np.empty((6, 0))
+    if len(_CANONICAL_LINE.findall(text)) == len(lines):
+        return np.loadtxt(lines, usecols=(1, 3, 5, 7, 9, 11), ndmin=2).T
+    rows = [row for row in map(_parse_line, lines) if row is not None]
+    return np.array(rows, dtype=float).reshape(-1, 6).T
+
+# Number of moves parse_block(text) returns, without converting any numbers
+def count_block_moves(text):
+    lines = _MOTION_LINE.findall(text)
+    if len(_CANONICAL_LINE.findall(text)) == len(lines):
+        return len(lines)
+    return sum(_parse_line(line) is not None for line in lines)
+
+# Stream the file as (6, n) blocks without holding the whole program
+def iter_gcode_blocks(file_path, chunk_size=DEFAULT_CHUNK_SIZE, use_mmap=False, offset=0):
+    for text in iter_text_chunks(file_path, chunk_size, use_mmap, offset):
+        block = parse_block(text)
+        if block.shape[1]:
+            yield block
+
+# Upper bound on kept rows: number of lines starting with "X"
+def count_motion_lines(file_path, chunk_size=DEFAULT_CHUNK_SIZE, use_mmap=False):
+    count = 0
+    for text in iter_text_chunks(file_path, chunk_size, use_mmap):
+        count += text.count(b"\nX") + text.startswith(b"X")
+    return count
+
+# Parse the whole file into one preallocated (6, n) float64 array.
+# With use_mmap the input is memory-mapped and the result lives in a temporary
+# disk-backed array, so programs larger than RAM can still be loaded.
+def parse_gcode(file_path, chunk_size=DEFAULT_CHUNK_SIZE, use_mmap=False):
+    capacity = count_motion_lines(file_path, chunk_size, use_mmap)
+    if use_mmap:
+        out = np.memmap(tempfile.TemporaryFile(), dtype=np.float64, mode='w+', shape=(6, max(capacity, 1)))
+    else:
+        out = np.empty((6, capacity))
+    n = 0
+    for block in iter_gcode_blocks(file_path, chunk_size, use_mmap):
+        m = block.shape[1]
+        out[:, n:n + m] = block
+        n += m
+    return out[:, :n]
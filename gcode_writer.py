@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Buffered G-code writer shared by the toolpath emitters.
+
+Moves are handled as (n, 3) blocks of X, Y, Z. The constant U/V/W tail of every
+line is rendered once by the formatter, and each block is formatted with a single
+%-substitution instead of one f-string per line. The controller preamble and the
+line templates come from machine_profile.
+
+@author: kangputong
+"""
+
+import os
+import numpy as np
+
+DEFAULT_BUFFER_SIZE = 1 << 20   # bytes held before the OS write
+DEFAULT_CHUNK_PAIRS = 8192      # control pairs turned into moves per block
+
+# Formats (n, k) blocks with a line template of k %-fields, one substitution per block
+# (machine_profile builds these templates for its axis letters)
+class LineTemplateFormatter:
+    def __init__(self, line_template):
+        self.line_template = line_template
+
+    def __call__(self, moves):
+        moves = np.asarray(moves, dtype=float)
+        return (self.line_template * len(moves)) % tuple(moves.ravel().tolist())
+
+# Writes go to "<file>.tmp", which replaces the file only when the block exits
+# cleanly; on an error or a cancelled job the partial file is removed instead.
+class GcodeWriter:
+    def __init__(self, file_path, formatter=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.file_path = file_path
+        self.tmp_path = file_path + ".tmp"
+        self.formatter = formatter
+        self.buffer_size = buffer_size
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, 'w', buffering=self.buffer_size)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        self.file = None
+        if exc_type is None:
+            os.replace(self.tmp_path, self.file_path)
+        else:
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+
+    # Raw text, e.g. header and footer lines
+    def write_lines(self, lines):
+        self.file.writelines(lines)
+
+    # One (n, 3) block of moves
+    def write_moves(self, xyz):
+        if len(xyz):
+            self.file.write(self.formatter(xyz))
+
+    # An iterable of (n, 3) blocks, e.g. from toolpath_moves
+    def write_move_blocks(self, blocks):
+        for xyz in blocks:
+            self.write_moves(xyz)
+
+# Expand ordered control points into plunge / cut / retract / jog moves, chunk by chunk.
+# Each pair gives (pt1, -thinning_t), (pt2, -thinning_t), then unless it is the
+# last pair (pt2, z_hold) and (next pt1, z_hold), matching write_Gcodes line for line.
+# next_pt: first point of the pass after these when control_pts is one chunk of a
+# longer sequence, so the last pair also gets its retract and jog.
+def toolpath_moves(control_pts, thinning_t, z_hold, chunk_pairs=DEFAULT_CHUNK_PAIRS, next_pt=None):
+    num_pairs = len(control_pts) // 2
+    for start in range(0, num_pairs, chunk_pairs):
+        stop = min(start + chunk_pairs, num_pairs)
+        pts = np.asarray(control_pts[2 * start:2 * stop], dtype=float).reshape(-1, 2, 2)
+        k = len(pts)
+
+        next_pts = np.empty((k, 2))
+        next_pts[:-1] = pts[1:, 0]
+        is_last_chunk = stop == num_pairs and next_pt is None
+        if stop < num_pairs:
+            next_pts[-1] = np.asarray(control_pts[2 * stop], dtype=float)
+        elif next_pt is not None:
+            next_pts[-1] = np.asarray(next_pt, dtype=float)
+
+        moves = np.empty((k, 4, 3))
+        moves[:, 0, :2] = pts[:, 0]
+        moves[:, 1, :2] = pts[:, 1]
+        moves[:, 2, :2] = pts[:, 1]
+        moves[:, 3, :2] = next_pts
+        moves[:, :2, 2] = -thinning_t
+        moves[:, 2:, 2] = z_hold
+        moves = moves.reshape(-1, 3)
+        yield moves[:-2] if is_last_chunk else moves
@@ -9,10 +9,21 @@ GUI for texture patch
 import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.filedialog import askdirectory
-from texture_dual import Initializer, generate_control_pairs, reorder_control_points_dual, write_Gcodes
+from texture_dual import Initializer, cached_control_pairs, reorder_control_points_dual, write_Gcodes, compare_pass_orders
 from texture_edge_new import generate_edge_gcode
 from ampl_visualization_GUI import AmplVisualization
+from toolpath_cache import ToolpathCache
+from cycle_estimator import estimate_from_points, format_estimate
+from point_reduction import format_reduction
+from stage_profiler import PROFILER
+from job_runner import JobRunner
+from toolpath_export import FORMATS, export_path
+from preview_panel import PathPreview, PreviewRequest
+from dual_tool import STRATEGIES, BottomTool, format_clearance
+from machine_profile import DEFAULT_PROFILE, list_profiles, profile_tag
 import os
+import copy
+import time
 
 class TextureGUI:
     def __init__(self, root):
@@ -20,6 +31,8 @@ class TextureGUI:
         root.title("Texture Morph Toolpath Generator")
 
         self.t = Initializer()
+        self.cache = ToolpathCache()
+        PROFILER.enable()
 
         style = ttk.Style()
         common_font = ("Arial", 12)
@@ -70,18 +83,63 @@ class TextureGUI:
 
         ttk.Label(input_frame, text="Motion Direction:").grid(row=6, column=0, sticky="e")
         self.dir_var = tk.StringVar(value="inward")
-        dir_menu = ttk.Combobox(input_frame, textvariable=self.dir_var, values=["inward", "outward"])
+        dir_menu = ttk.Combobox(input_frame, textvariable=self.dir_var, values=["inward", "outward", "travel"])
         dir_menu.grid(row=6, column=1, sticky="ew", padx=5, pady=6)
 
+        # Optional point reduction tolerance, blank = write every point
+        ttk.Label(input_frame, text="Tolerance (mm):").grid(row=7, column=0, sticky="e")
+        self.tol_entry = ttk.Entry(input_frame)
+        self.tol_entry.grid(row=7, column=1, sticky="ew", padx=5, pady=6)
+
+        # Bottom tool motion, "park" keeps it at the patch centre
+        ttk.Label(input_frame, text="Bottom Tool:").grid(row=8, column=0, sticky="e")
+        self.bottom_var = tk.StringVar(value="park")
+        bottom_menu = ttk.Combobox(input_frame, textvariable=self.bottom_var, values=list(STRATEGIES), state="readonly")
+        bottom_menu.grid(row=8, column=1, sticky="ew", padx=5, pady=6)
+
+        # Machine profile (machine_profiles/): controller header and axis letters
+        ttk.Label(input_frame, text="Machine:").grid(row=9, column=0, sticky="e")
+        self.profile_var = tk.StringVar(value=DEFAULT_PROFILE)
+        profile_menu = ttk.Combobox(input_frame, textvariable=self.profile_var, values=list_profiles(), state="readonly")
+        profile_menu.grid(row=9, column=1, sticky="ew", padx=5, pady=6)
+
         # Operation buttons
         ttk.Button(action_frame, text="Generate G-code", command=self.generate_gcode).grid(row=0, column=0, pady=10, sticky="ew")
+        self.estimate_label = ttk.Label(action_frame, text="", font=("Arial", 9), justify="left")
+        self.estimate_label.grid(row=0, column=1, padx=8, sticky="w")
         ttk.Button(action_frame, text="Visualize Path", command=self.visualize_popup).grid(row=1, column=0, pady=10, sticky="ew")
-        ttk.Button(action_frame, text="Save to Excel", command=self.save_excel).grid(row=2, column=0, pady=10, sticky="ew")
+        ttk.Button(action_frame, text="Export Data", command=self.export_data).grid(row=2, column=0, pady=10, sticky="ew")
+        self.export_var = tk.StringVar(value="xlsx")
+        export_menu = ttk.Combobox(action_frame, textvariable=self.export_var, values=list(FORMATS), width=8, state="readonly")
+        export_menu.grid(row=2, column=1, padx=8, sticky="w")
         ttk.Button(action_frame, text="Generate Edge G-code", command=self.generate_edge).grid(row=3, column=0, pady=10, sticky="ew")
 
+        # Live hatch preview, redrawn shortly after the inputs change
+        preview_frame = ttk.LabelFrame(root, text="Preview", padding=5, relief="groove")
+        preview_frame.grid(row=0, column=2, sticky="nsew", padx=10, pady=10)
+        self.preview = PathPreview(root, preview_frame)
+        self.preview.widget.pack(fill="both", expand=True)
+        self.preview.info_label.pack(anchor="w")
+        for widget in [loc_menu, mode_menu, dir_menu, *self.entries.values()]:
+            widget.bind("<KeyRelease>", self.schedule_preview)
+        for widget in [loc_menu, mode_menu, dir_menu]:
+            widget.bind("<<ComboboxSelected>>", self.schedule_preview)
+
+        # Progress of the running job, Cancel stops it (queued jobs still run)
+        progress_frame = ttk.Frame(root)
+        progress_frame.columnconfigure(0, weight=1)
+        progress_frame.grid(row=1, column=0, columnspan=3, sticky="ew", padx=10)
+        self.progress = ttk.Progressbar(progress_frame, mode="determinate", maximum=1.0)
+        self.progress.grid(row=0, column=0, sticky="ew", pady=4)
+        self.cancel_button = ttk.Button(progress_frame, text="Cancel", command=self.cancel_job, state="disabled")
+        self.cancel_button.grid(row=0, column=1, padx=(8, 0))
+
         # Status bar
         self.status = tk.Label(root, text="Ready", anchor="w", relief="sunken", font=("Arial", 10))
-        self.status.grid(row=2, column=0, columnspan=2, sticky="ew")
+        self.status.grid(row=2, column=0, columnspan=3, sticky="ew")
+
+        self.jobs = JobRunner(root, on_progress=self.show_progress, on_idle=self.jobs_idle)
+        root.protocol("WM_DELETE_WINDOW", self.close)
 
     def update_initializer(self):
         try:
@@ -92,77 +150,197 @@ class TextureGUI:
             self.t.z_hold = float(self.entries['z_hold'].get())
             self.t.mode = self.mode_var.get()
             self.t.direction = self.dir_var.get()
+            tolerance = self.tol_entry.get().strip()
+            self.t.tolerance = float(tolerance) if tolerance else None
+            self.t.bottom = self.bottom_var.get()
+            self.t.profile = self.profile_var.get()
             self.t.set_texture_bounds()
         except Exception as e:
             messagebox.showerror("Input Error", f"Invalid input: {e}")
 
+    # Preview inputs straight from the widgets (no error boxes while typing)
+    def read_preview_request(self):
+        sp, angle = self.entries['sp'].get().strip(), self.entries['angle'].get().strip()
+        if not sp or not angle:
+            raise ValueError("enter spacing and angle")
+        return PreviewRequest(self.loc_var.get(), sp, angle, self.mode_var.get(), self.dir_var.get())
+
+    def schedule_preview(self, event=None):
+        self.preview.schedule(self.read_preview_request)
+
+    # Queue a background job; by default its result is the message for the status bar
+    def submit_job(self, label, func, on_done=None):
+        self.jobs.submit(label, func, on_done or self.show_result, lambda exc: self.show_error(label, exc))
+        if self.jobs.queued():
+            self.status.config(text=f"Queued: {label} ({self.jobs.queued()} waiting)")
+
+    def show_progress(self, job, fraction, text):
+        self.cancel_button.config(state="normal")
+        if fraction is None:
+            self.progress.config(mode="indeterminate")
+            if text == "cancelled":
+                self.progress.stop()
+            else:
+                self.progress.start(15)
+        else:
+            if str(self.progress.cget("mode")) != "determinate":
+                self.progress.stop()
+                self.progress.config(mode="determinate")
+            self.progress["value"] = fraction
+        waiting = f" ({self.jobs.queued()} queued)" if self.jobs.queued() else ""
+        self.status.config(text=f"{job.label}: {text or f'{fraction:.0%}'}{waiting}")
+
+    def show_result(self, message):
+        summary = PROFILER.summary()
+        self.status.config(text=" | ".join(part for part in (message, summary) if part).replace("\n", " | "))
+        if message:
+            messagebox.showinfo("Done", message)
+
+    def show_error(self, label, exc):
+        self.status.config(text=f"{label} failed: {exc}")
+        messagebox.showerror("Error", f"Error running {label}: {exc}")
+
+    def jobs_idle(self):
+        self.progress.stop()
+        self.progress.config(mode="determinate")
+        self.progress["value"] = 0
+        self.cancel_button.config(state="disabled")
+
+    def cancel_job(self):
+        self.jobs.cancel_current()
+
+    def close(self):
+        self.jobs.shutdown()
+        self.preview.close()
+        self.root.destroy()
+
     def generate_gcode(self):
         self.update_initializer()
-        pairs = generate_control_pairs(self.t.ini_pt, self.t.fin_pt, self.t.angle, self.t.sp)
-        ordered_pts = reorder_control_points_dual(pairs, mode=self.t.mode, direction=self.t.direction)
+        t = copy.copy(self.t)   # later edits must not change a queued job
+        start = time.perf_counter()
         base_dir = askdirectory(title="Select output folder")
+        dialog_s = time.perf_counter() - start
         if not base_dir:
             return
-        folder = os.path.join(base_dir, f"texture_patch_{self.t.formatted_date}")
-        os.makedirs(folder, exist_ok=True)
-        path = os.path.join(folder, f"texture_patch_loc{self.t.loc}_{self.t.mode}_{self.t.direction}.txt")
-        write_Gcodes(ordered_pts, path, self.t.ini_pt, self.t.fin_pt, self.t.thinning_t, self.t.z_hold)
-        self.status.config(text=f"G-code saved to: {path}")
-        messagebox.showinfo("Done", f"G-code saved to: {path}")
-        self.last_path = path
+        folder = os.path.join(base_dir, f"texture_patch_{t.formatted_date}")
+        bottom = "" if t.bottom == "park" else f"_{t.bottom}"
+        path = os.path.join(folder, f"texture_patch_loc{t.loc}_{t.mode}_{t.direction}{bottom}{profile_tag(t.profile)}.txt")
+
+        def job(report):
+            PROFILER.add_time("dialog", dialog_s)
+            report(0.0, "generating passes")
+            pairs = cached_control_pairs(t.ini_pt, t.fin_pt, t.angle, t.sp)
+            ordered_pts = reorder_control_points_dual(pairs, mode=t.mode, direction=t.direction)
+            estimate = format_estimate(estimate_from_points(ordered_pts, t.thinning_t, t.z_hold, profile=t.profile))
+            os.makedirs(folder, exist_ok=True)
+            bottom_tool = self.bottom_tool(t)
+            reduction = write_Gcodes(ordered_pts, path, t.ini_pt, t.fin_pt, t.thinning_t, t.z_hold,
+                                     tolerance=t.tolerance, progress=report, bottom_tool=bottom_tool,
+                                     profile=t.profile)
+            message = f"G-code saved to: {path}"
+            if reduction is not None:
+                message += "\n" + format_reduction(reduction, os.path.getsize(path))
+            if bottom_tool is not None:
+                message += "\n" + format_clearance(bottom_tool.clearance)
+            if t.direction == "travel":
+                saving = compare_pass_orders(pairs, t.mode, travel_pts=ordered_pts, profile=t.profile)
+                message += f"\nTravel order saves ~{saving['saved_s']:.0f} s of jog time vs inward/outward"
+            return estimate, message
+
+        def done(result):
+            estimate, message = result
+            self.estimate_label.config(text=estimate)
+            self.last_path = path
+            self.show_result(message)
+
+        self.submit_job("generate_gcode", job, done)
+
+    # None keeps the parked bottom tool of write_Gcodes
+    @staticmethod
+    def bottom_tool(t):
+        if t.bottom == "park":
+            return None
+        return BottomTool.for_patch(t.bottom, t.ini_pt, t.fin_pt)
 
     def visualize_popup(self):
-        if not hasattr(self, 'last_path'):
-            messagebox.showerror("No G-code", "Please generate a G-code first.")
-            return
         popup = tk.Toplevel()
         popup.title("Select Visualization Method")
         tk.Label(popup, text="Choose visualization type:", font=("Arial", 12)).pack(pady=5)
         for method in ["comet", "comet3", "plot3d_static"]:
             tk.Button(popup, text=method, font=("Arial", 12), command=lambda m=method: self.run_visualize(m, popup)).pack(pady=3)
-            
+
+    # The path for the current inputs is expanded in memory on the worker, so it can
+    # be viewed before any G-code is written; the plot windows open on the Tk thread
     def run_visualize(self, method, popup):
         popup.destroy()
-        visualizer = AmplVisualization()
+        self.update_initializer()
+        t = copy.copy(self.t)
+        visualizer = AmplVisualization(cache=self.cache)
         method_mapping = {
-            "comet": visualizer.comet_from_file,
-            "comet3": visualizer.comet3_from_file,
-            "plot3d_static": visualizer.plot3d_static_from_file
+            "comet": lambda x, y, z: visualizer.comet(x, y),
+            "comet3": visualizer.comet3,
+            "plot3d_static": visualizer.plot3d_static
         }
-        try:
-            method_mapping[method](self.last_path)
-        except Exception as e:
-            messagebox.showerror("Visualization Error", f"Error running {method}: {e}")
 
-    def save_excel(self):
+        def job(report):
+            report(None, "expanding passes")
+            pairs = cached_control_pairs(t.ini_pt, t.fin_pt, t.angle, t.sp)
+            ordered_pts = reorder_control_points_dual(pairs, mode=t.mode, direction=t.direction)
+            bottom_tool = self.bottom_tool(t)
+            data = visualizer.parse_points(ordered_pts, t.ini_pt, t.fin_pt, t.thinning_t, t.z_hold,
+                                           t.tolerance, bottom_tool, t.profile)
+            return data, visualizer.clearance_moves(*data, bottom_tool)
+
+        def done(result):
+            (x, y, z, u, v, w), violations = result
+            self.status.config(text=PROFILER.summary())
+            method_mapping[method](x, y, z)
+            visualizer.plot_top_bottom(x, y, u, v, violations)
+
+        self.submit_job(method, job, done)
+
+    def export_data(self):
         if not hasattr(self, 'last_path'):
             messagebox.showerror("No G-code", "Please generate a G-code first.")
             return
-        visualizer = AmplVisualization()
+        visualizer = AmplVisualization(cache=self.cache)
+        path = self.last_path
+        fmt = self.export_var.get()
         base_dir = askdirectory(title="Select output folder")
         if not base_dir:
             return
         folder = os.path.join(base_dir, f"texture_patch_{self.t.formatted_date}")
-        os.makedirs(folder, exist_ok=True)
-        visualizer.save_to_excel(self.last_path)
-        self.status.config(text="Excel file saved.")
-        messagebox.showinfo("Done", "Excel file saved.")
+        out_path = export_path(path, fmt, folder)
+
+        def job(report):
+            os.makedirs(folder, exist_ok=True)
+            report(None, f"writing {fmt} file")
+            rows = visualizer.export(path, fmt, out_path, progress=report)
+            return f"{rows:,} rows exported to {out_path}"
+
+        self.submit_job("export", job)
 
     def generate_edge(self):
         self.update_initializer()
-        generate_edge_gcode(self.t.loc)
-        self.status.config(text="Edge path generated.")
-        messagebox.showinfo("Done", "Edge path generated.")
+        loc = self.t.loc
+        profile = self.t.profile
+
+        def job(report):
+            generate_edge_gcode(loc, profile)
+            return "Edge path generated."
+
+        self.submit_job("generate_edge", job)
 
 if __name__ == "__main__":
     root = tk.Tk()
     screen_w = root.winfo_screenwidth()
     screen_h = root.winfo_screenheight()
-    root.geometry("800x400")
+    root.geometry("1160x520")
     root.resizable(False, False)
 
     root.columnconfigure(0, weight=1)
     root.columnconfigure(1, weight=1)
+    root.columnconfigure(2, weight=1)
     root.rowconfigure(0, weight=1)
     app = TextureGUI(root)
     root.mainloop()
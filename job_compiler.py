@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-patch job compiler: several texture patches (and their edge passes) in one
+machine program.
+
+Each patch is turned into a program section (approach at Z 80, passes, back home)
+in a worker process. The sections are written in the order they were requested,
+each one as soon as it and every section before it are done, under a single
+controller header and one CLOSE ALL. Every section starts and ends at the home
+position (Z 80, W -80), so moving from one patch to the next is always a safe
+retracted move.
+
+JSON / TOML spec:
+    {"output": "sheet_program.txt",
+     "patches": [{"loc": "1", "sp": 0.5, "angle": 45, "thinning_t": 0.2, "z_hold": 2.0,
+                  "mode": "zig_zag", "direction": "travel", "edge": true},
+                 {"loc": "3", "sp": 1.0, "angle": 0, "thinning_t": 0.3, "z_hold": 2.0}]}
+
+CSV spec: one patch per row with the same column names. As in batch_toolpath, a
+value list expands into several patches, in order.
+
+"profile" selects the machine profile (machine_profile) of the whole program; the
+header and every section are written with it.
+
+Usage:
+    python job_compiler.py program.json [-o OUTPUT] [-j WORKERS]
+
+@author: kangputong
+"""
+
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from batch_toolpath import read_spec, expand_job
+from gcode_writer import GcodeWriter
+from machine_profile import DEFAULT_PROFILE, get_profile
+from texture_dual import texture_bounds, cached_control_pairs, reorder_control_points_dual, texture_section
+from texture_edge_new import edge_section
+
+PENDING_PER_WORKER = 2  # sections computed ahead of the writer, per worker
+
+def _as_flag(value):
+    if isinstance(value, list):
+        value = value[0] if value else False
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+# Normalized patch list from a spec dict ("patches", or "jobs" for CSV specs)
+def expand_patches(spec):
+    profile = spec.get("profile", DEFAULT_PROFILE)
+    patches = []
+    for entry in spec.get("patches", spec.get("jobs", [])):
+        edge = _as_flag(entry.get("edge", False))
+        fields = {"profile": profile, **{key: value for key, value in entry.items() if key != "edge"}}
+        for job in expand_job(fields):
+            if job["profile"] != profile:
+                raise ValueError(f"Patch profile {job['profile']} differs from the program profile {profile}")
+            patches.append({**job, "edge": edge})
+    return patches
+
+# Worker: program text of one patch, texture first and then its edge pass
+def compile_patch(patch):
+    ini_pt, fin_pt = texture_bounds(patch["loc"])
+    pairs = cached_control_pairs(ini_pt, fin_pt, patch["angle"], patch["sp"])
+    if len(pairs) == 0:
+        raise ValueError(f"Patch at location {patch['loc']} has no passes (spacing {patch['sp']:g} mm)")
+    ordered_pts = reorder_control_points_dual(pairs, mode=patch["mode"], direction=patch["direction"])
+    parts = list(texture_section(ordered_pts, ini_pt, fin_pt, patch["thinning_t"], patch["z_hold"],
+                                 profile=patch.get("profile")))
+    if patch["edge"]:
+        parts.extend(edge_section(patch["loc"], patch.get("profile")))
+    return "".join(parts)
+
+# Section texts in request order. A bounded number of patches run ahead of the
+# one being written, so memory stays at a few sections however long the list is.
+# worker is the (picklable, top-level) function turning one item into its text.
+def iter_sections(patches, workers=None, worker=compile_patch):
+    if workers is not None and workers <= 1:
+        yield from map(worker, patches)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for patch in patches:
+            pending.append(pool.submit(worker, patch))
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# Write one program for all patches. GcodeWriter goes through a temp file, so a
+# failed patch never leaves a partial program behind. Returns (sections, bytes written).
+def compile_program(patches, file_path, workers=None, profile=None):
+    profile = get_profile(profile)
+    with GcodeWriter(file_path) as writer:
+        writer.write_lines([profile.program_start])
+        for text in iter_sections(patches, workers):
+            writer.write_lines([text])
+        writer.write_lines([profile.footer])
+    return len(patches), os.path.getsize(file_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile several texture patches into one G-code program.")
+    parser.add_argument("spec", help="patch list (.json, .toml or .csv)")
+    parser.add_argument("-o", "--output", help="program file (overrides the spec)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    spec = read_spec(args.spec)
+    patches = expand_patches(spec)
+    output = args.output or spec.get("output") or "sheet_program.txt"
+    start = time.perf_counter()
+    sections, size = compile_program(patches, output, args.jobs, spec.get("profile"))
+    elapsed = time.perf_counter() - start
+    print(f"{sections} patches -> {output} ({size / 1e6:.1f} MB) in {elapsed:.2f} s")
+
+if __name__ == "__main__":
+    main()
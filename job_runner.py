@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Background jobs for the Tk GUI.
+
+Jobs run one after another on a worker thread, so several can be queued while
+the window stays responsive. A job function gets a `report(fraction, text=None)`
+callback: it sends progress to the GUI and raises JobCancelled once the job has
+been cancelled, so passing it as a writer's progress hook stops the write at the
+next block (GcodeWriter then drops its temp file). Results, progress and errors
+are handed back through a queue that the Tk main loop drains every POLL_MS with
+`after`; all callbacks run on the Tk thread.
+
+@author: kangputong
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from stage_profiler import PROFILER
+
+POLL_MS = 50                # Tk polling interval
+PROGRESS_INTERVAL = 0.05    # [s] minimum time between progress updates of a job
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, label, func, on_done=None, on_error=None):
+        self.label = label
+        self.func = func
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.last_report = 0.0
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+class JobRunner:
+    # on_progress(job, fraction, text) and on_idle() are called on the Tk thread;
+    # fraction is None while a job has not reported any progress yet
+    def __init__(self, root, on_progress=None, on_idle=None, poll_ms=POLL_MS):
+        self.root = root
+        self.on_progress = on_progress
+        self.on_idle = on_idle
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gui-job")
+        self.events = queue.Queue()
+        self.jobs = deque()         # running job first, then the queued ones
+        self.root.after(self.poll_ms, self.poll)
+
+    @property
+    def current(self):
+        return self.jobs[0] if self.jobs else None
+
+    def queued(self):
+        return max(len(self.jobs) - 1, 0)
+
+    # func(report) runs on the worker; on_done(result) / on_error(exc) on the Tk thread
+    def submit(self, label, func, on_done=None, on_error=None):
+        job = Job(label, func, on_done, on_error)
+        self.jobs.append(job)
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def cancel_current(self):
+        if self.current is not None:
+            self.current.cancel()
+
+    def cancel_all(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+    # Worker thread
+    def _run(self, job):
+        if job.cancelled:
+            self.events.put(("cancelled", job, None))
+            return
+        self.events.put(("started", job, None))
+
+        def report(fraction, text=None):
+            if job.cancelled:
+                raise JobCancelled()
+            now = time.perf_counter()
+            if fraction is None or fraction >= 1.0 or now - job.last_report >= PROGRESS_INTERVAL:
+                job.last_report = now
+                self.events.put(("progress", job, (fraction, text)))
+
+        try:
+            with PROFILER.run(job.label):
+                result = job.func(report)
+        except JobCancelled:
+            self.events.put(("cancelled", job, None))
+        except Exception as exc:
+            self.events.put(("error", job, exc))
+        else:
+            self.events.put(("done", job, result))
+
+    # Tk thread: hand queued events to their callbacks
+    def poll(self):
+        try:
+            while True:
+                kind, job, payload = self.events.get_nowait()
+                self._dispatch(kind, job, payload)
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.poll_ms, self.poll)
+
+    def _dispatch(self, kind, job, payload):
+        if kind == "started":
+            self._progress(job, None, "started")
+        elif kind == "progress":
+            self._progress(job, *payload)
+        else:
+            if job in self.jobs:
+                self.jobs.remove(job)
+            if kind == "done" and job.on_done is not None:
+                job.on_done(payload)
+            elif kind == "error" and job.on_error is not None:
+                job.on_error(payload)
+            elif kind == "cancelled":
+                self._progress(job, None, "cancelled")
+            if not self.jobs and self.on_idle is not None:
+                self.on_idle()
+
+    def _progress(self, job, fraction, text):
+        if self.on_progress is not None:
+            self.on_progress(job, fraction, text)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-layer step-down scheduler for incremental forming.
+
+A schedule gives the depth of every layer (the thinning of that pass) and rules for
+the angle and spacing of each layer. Every layer becomes a program section
+(approach at Z 80, the hatch at -depth, back home, as in job_compiler), and the
+sections are streamed into one program in schedule order.
+
+Rules (for angle, sp, and also depths):
+    15                              the same value for every layer
+    [0, 90]                         cycled over the layers
+    {"start": 0, "step": 30}        start + step * layer index
+"layers" overrides single layers by index.
+
+Layers with the same location, angle and spacing share their hatch geometry
+(cached_control_pairs), and with the same mode and direction also their pass
+order, so a 0/90 cross-hatch over twenty depths builds two geometries.
+
+Next to the program, "<program>.layers.json" records every layer's parameters and
+position. When the schedule is compiled again, layers whose parameters did not
+change are copied from the old program and only edited or new layers are
+generated and spliced in between. The old program is only reused while its size
+and mtime match the index, it was written for the same machine profile, and the
+generator sources and the profile file are older than it.
+
+JSON / TOML spec:
+    {"output": "layers.txt", "loc": "1", "z_hold": 2.0, "profile": "ampl",
+     "mode": "zig_zag", "direction": "travel",
+     "depths": {"start": 0.1, "step": 0.1, "count": 10},
+     "angle": [0, 90], "sp": 0.5,
+     "layers": {"9": {"sp": 0.25}}}
+
+Usage:
+    python layer_scheduler.py layers.json [-o OUTPUT] [-j WORKERS] [--force]
+
+@author: kangputong
+"""
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+import time
+from batch_toolpath import read_spec, DEFAULTS, source_files
+from gcode_writer import GcodeWriter
+from job_compiler import iter_sections
+from machine_profile import get_profile
+from texture_dual import texture_bounds, cached_control_pairs, reorder_control_points_dual, texture_section
+
+ORDER_CACHE_SIZE = 16       # pass orders kept per worker process
+INDEX_SUFFIX = ".layers.json"
+COPY_BLOCK = 16 << 20       # characters per read when copying unchanged layers
+LAYER_FIELDS = ("loc", "depth", "angle", "sp", "z_hold", "mode", "direction")
+
+# Value of a rule for layer `index` (see the module docstring)
+def rule_value(rule, index):
+    if isinstance(rule, dict):
+        return rule["start"] + rule.get("step", 0) * index
+    if isinstance(rule, list):
+        return rule[index % len(rule)]
+    return rule
+
+def _layer_count(spec):
+    depths = spec["depths"]
+    if isinstance(depths, list):
+        return len(depths)
+    if isinstance(depths, dict) and "count" in depths:
+        return int(depths["count"])
+    raise ValueError("depths must be a list or a {start, step, count} rule")
+
+# One parameter dict per layer, in schedule order
+def layer_plan(spec):
+    overrides = {int(key): value for key, value in spec.get("layers", {}).items()}
+    plan = []
+    for index in range(_layer_count(spec)):
+        layer = {**DEFAULTS, **{name: spec[name] for name in LAYER_FIELDS if name in spec}}
+        layer["depth"] = rule_value(spec["depths"], index)
+        layer["angle"] = rule_value(spec.get("angle", 0.0), index)
+        layer["sp"] = rule_value(spec["sp"], index)
+        layer.update(overrides.get(index, {}))
+        missing = [name for name in LAYER_FIELDS if name not in layer]
+        if missing:
+            raise ValueError(f"Layer {index} is missing {', '.join(missing)}")
+        layer = {name: layer[name] for name in LAYER_FIELDS}
+        layer["loc"] = str(layer["loc"])
+        for name in ("depth", "angle", "sp", "z_hold"):
+            layer[name] = float(layer[name])
+        plan.append(layer)
+    return plan
+
+# Pass order of one geometry, shared by all layers that only differ in depth
+@functools.lru_cache(maxsize=ORDER_CACHE_SIZE)
+def _ordered_points(loc, angle, sp, mode, direction):
+    ini_pt, fin_pt = texture_bounds(loc)
+    pairs = cached_control_pairs(ini_pt, fin_pt, angle, sp)
+    if len(pairs) == 0:
+        raise ValueError(f"Layer at location {loc} has no passes (spacing {sp:g} mm)")
+    return reorder_control_points_dual(pairs, mode=mode, direction=direction)
+
+# Worker: program text of one layer
+def compile_layer(layer):
+    ini_pt, fin_pt = texture_bounds(layer["loc"])
+    ordered_pts = _ordered_points(layer["loc"], layer["angle"], layer["sp"], layer["mode"], layer["direction"])
+    return "".join(texture_section(ordered_pts, ini_pt, fin_pt, layer["depth"], layer["z_hold"],
+                                   profile=layer.get("profile")))
+
+def index_path(file_path):
+    return file_path + INDEX_SUFFIX
+
+def _layer_key(layer):
+    return json.dumps(layer, sort_keys=True)
+
+# Where the old program's layers are, by parameters: (seek position, characters),
+# or {} when the old program cannot be reused
+def reusable_layers(file_path, profile=None):
+    profile = get_profile(profile)
+    try:
+        with open(index_path(file_path), 'r') as file:
+            index = json.load(file)
+        st = os.stat(file_path)
+    except (OSError, ValueError):
+        return {}
+    # Every local module a layer's text depends on, job_compiler and texture_edge_new included
+    sources = list(source_files("layer_scheduler")) + [profile.path]
+    newest_source = max(os.path.getmtime(path) for path in sources)
+    if (index.get("size") != st.st_size or index.get("mtime_ns") != st.st_mtime_ns
+            or index.get("profile") != profile.name or newest_source > st.st_mtime):
+        return {}
+    return {_layer_key(entry["layer"]): (entry["start"], entry["chars"]) for entry in index["layers"]}
+
+def _copy_layer(source, writer, start, chars):
+    source.seek(start)
+    while chars > 0:
+        text = source.read(min(COPY_BLOCK, chars))
+        if not text:
+            raise OSError("Program is shorter than its layer index")
+        writer.write_lines([text])
+        chars -= len(text)
+
+# Write the program for a layer plan, splicing unchanged layers from the previous
+# program at file_path. Positions are text-file positions (tell / seek), so the
+# index also holds where newlines are written as CRLF.
+# Returns (layers, layers generated, bytes written).
+def compile_layers(plan, file_path, workers=None, force=False, profile=None):
+    old = {} if force else reusable_layers(file_path, profile)
+    todo = [{**layer, "profile": profile} for layer in plan if _layer_key(layer) not in old]
+    sections = iter_sections(todo, workers, worker=compile_layer)
+    profile_name = get_profile(profile).name
+    entries = []
+    with GcodeWriter(file_path) as writer:
+        writer.write_lines([get_profile(profile).program_start])
+        # The old program is closed again before the writer replaces it
+        with open(file_path, 'r') if old else contextlib.nullcontext() as source:
+            for layer in plan:
+                start = writer.file.tell()
+                reuse = old.get(_layer_key(layer))
+                if reuse is not None:
+                    _copy_layer(source, writer, *reuse)
+                    chars = reuse[1]
+                else:
+                    text = next(sections)
+                    writer.write_lines([text])
+                    chars = len(text)
+                entries.append({"layer": layer, "start": start, "chars": chars})
+        writer.write_lines([get_profile(profile).footer])
+    st = os.stat(file_path)
+    with open(index_path(file_path), 'w') as file:
+        json.dump({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "profile": profile_name, "layers": entries}, file)
+    return len(plan), len(todo), st.st_size
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a multi-layer step-down schedule into one program.")
+    parser.add_argument("spec", help="layer schedule (.json or .toml)")
+    parser.add_argument("-o", "--output", help="program file (overrides the spec)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="regenerate every layer")
+    args = parser.parse_args(argv)
+
+    spec = read_spec(args.spec)
+    plan = layer_plan(spec)
+    output = args.output or spec.get("output") or "layers.txt"
+    start = time.perf_counter()
+    layers, generated, size = compile_layers(plan, output, args.jobs, args.force, spec.get("profile"))
+    elapsed = time.perf_counter() - start
+    print(f"{layers} layers ({generated} generated, {layers - generated} reused) -> {output} "
+          f"({size / 1e6:.1f} MB) in {elapsed:.2f} s")
+
+if __name__ == "__main__":
+    main()
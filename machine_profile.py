@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Machine profiles: everything controller specific that the G-code emitters write.
+
+A profile file (.json or .toml, in machine_profiles/ or anywhere by path) gives
+the controller preamble (coordinate system, motor definitions, program number,
+feedrate axes, TA / TS), the feed, the axis letters, and the home, approach and
+park positions. Loading a profile renders all of it once:
+  header           preamble lines, written as one string
+  program_start    header + the first home move, the start of every program
+  home_line / home_return, approach_template, dual_template, parked_formatter(..)
+                   line templates (%-style) shared by write_Gcodes, job_compiler,
+                   layer_scheduler, chunked_pipeline and texture_edge_new
+Loaded profiles are cached per process, so a batch run over thousands of jobs
+renders each profile's header once per worker.
+Emitters take the profile name (or path, or a MachineProfile); None is the
+default profile, whose output is the same as the original hard-coded preamble.
+
+{"name": "ampl",
+ "axes": {"X": "X", "Y": "Y", "Z": "Z", "U": "U", "V": "V", "W": "W"},
+ "coord_system": 1, "program": 2,
+ "motors": [[1, -16000, "X"], ...],          motor number, counts/mm, axis
+ "feedrate_axes": ["X", "Y", "Z"],
+ "accel_ms": 100.0, "scurve_ms": 50,          TA / TS, written as given
+ "feed": 5.0,
+ "home": {"X": 0.0, ..., "W": -80.0},
+ "approach": {"Z": 80.0, "W": -80.0}, "park": {"W": 0.0},
+ "precision": 4, "footer": "CLOSE ALL"}
+
+"axes" maps the axis names used here to the controller's letters (for motors,
+FRAX and every move). gcode_parser only reads the default letters.
+
+Usage:
+    python machine_profile.py [PROFILE] [--list]
+
+@author: kangputong
+"""
+
+import argparse
+import functools
+import json
+import os
+from gcode_writer import LineTemplateFormatter
+
+try:
+    import tomllib
+except ImportError:     # Python < 3.11
+    tomllib = None
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "machine_profiles")
+PROFILE_EXTENSIONS = (".json", ".toml")
+DEFAULT_PROFILE = "ampl"
+PROFILE_CACHE_SIZE = 16     # profiles kept loaded per process
+FORMATTER_CACHE_SIZE = 64   # parked-tool formatters kept per profile
+MAX_PRECISION = 9           # decimals written per value
+AXES = ("X", "Y", "Z", "U", "V", "W")
+REQUIRED = ("motors", "feed", "home")
+
+class MachineProfile:
+    def __init__(self, name, motors, feed, home, axes=None, coord_system=1, program=2,
+                 feedrate_axes=("X", "Y", "Z"), accel_ms=100.0, scurve_ms=50, approach=None, park=None,
+                 precision=4, footer="CLOSE ALL", description="", path=None):
+        self.name = name
+        self.description = description
+        self.path = path
+        self.axes = {axis: axis for axis in AXES}
+        self.axes.update(axes or {})
+        self.letters = tuple(self.axes[axis] for axis in AXES)
+        self.feed = float(feed)
+        self.accel_ms = accel_ms
+        self.scurve_ms = scurve_ms
+        self.home = tuple(float(home[axis]) for axis in AXES)
+        approach = {"Z": 80.0, "W": -80.0, **(approach or {})}
+        self.approach_z, self.approach_w = float(approach["Z"]), float(approach["W"])
+        self.park_w = float({"W": 0.0, **(park or {})}["W"])
+        if not isinstance(precision, int) or isinstance(precision, bool) or not 0 <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be a whole number of decimals from 0 to {MAX_PRECISION}, got {precision!r}")
+        self.precision = precision
+        self.number = f"%.{precision}f"
+        self.resolution = 10.0 ** -precision    # step of the written values
+
+        # Everything below is rendered once per profile
+        lines = ["DELGAT", "UNDEFINE ALL", f"&{coord_system}", "CLOSE"]
+        lines += [f"#{motor}->{counts}{self.axes[axis]}" for motor, counts, axis in motors]
+        lines += [f"OPEN PROG {program}", "CLEAR", f"FRAX({','.join(self.axes[a] for a in feedrate_axes)})",
+                  "ABS", f"TA {accel_ms}", f"TS {scurve_ms}"]
+        self.header = "".join(line + " \n" for line in lines)
+        self.footer = footer + "\n"
+        self.home_line = self._line(self.home, feed=True)
+        self.home_return = self._line(self.home)
+        placeholders = (None, None, self.approach_z, None, None, self.approach_w)
+        self.approach_template = self._line(placeholders)
+        self.dual_template = self._line((None,) * 6, end="\n")
+        self.program_start = self.header + self.home_line
+        # texture_edge_new has always ended these lines without the space
+        self.edge_home_line = self._line(self.home, feed=True, end="\n")
+        self.edge_home_return = self._line(self.home, end="\n")
+        self.edge_approach_template = self._line(placeholders, feed=True, end="\n")
+        self.dual_formatter = LineTemplateFormatter(self.dual_template)
+        self._parked = {}
+
+    @classmethod
+    def from_dict(cls, data, path=None):
+        missing = [key for key in REQUIRED if key not in data]
+        if missing:
+            raise ValueError(f"Machine profile {path or ''} is missing {', '.join(missing)}")
+        options = dict(data)
+        options.setdefault("name", os.path.splitext(os.path.basename(path))[0] if path else "profile")
+        try:
+            return cls(**options, path=path)
+        except TypeError as exc:
+            raise ValueError(f"Invalid machine profile {path or ''}: {exc}") from None
+
+    # One move line; None fields become %-placeholders
+    def _line(self, values, feed=False, end=" \n"):
+        fields = [f"{letter} {self.number}" if value is None else f"{letter} {self.number % value}"
+                  for letter, value in zip(self.letters, values)]
+        if feed:
+            fields.append(f"F {self.number % self.feed}")
+        return " ".join(fields) + end
+
+    # Formatter for (n, 3) X, Y, Z blocks with the bottom tool parked at a centre
+    def parked_formatter(self, center_x, center_y):
+        key = (center_x, center_y)
+        formatter = self._parked.get(key)
+        if formatter is None:
+            if len(self._parked) >= FORMATTER_CACHE_SIZE:
+                self._parked.clear()
+            formatter = LineTemplateFormatter(self._line((None, None, None, center_x, center_y, self.park_w), end="\n"))
+            self._parked[key] = formatter
+        return formatter
+
+    def approach_line(self, x, y, u, v):
+        return self.approach_template % (x, y, u, v)
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(PROFILE_DIR)
+                  if name.endswith(PROFILE_EXTENSIONS))
+
+# File of a profile name ("ampl") or path ("machines/other.toml")
+def profile_path(profile):
+    if profile.endswith(PROFILE_EXTENSIONS) or os.sep in profile or "/" in profile:
+        return profile
+    for ext in PROFILE_EXTENSIONS:
+        path = os.path.join(PROFILE_DIR, profile + ext)
+        if os.path.exists(path):
+            return path
+    raise ValueError(f"Unknown machine profile: {profile} (available: {', '.join(list_profiles()) or 'none'})")
+
+def read_profile(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".toml":
+        if tomllib is None:
+            raise RuntimeError("TOML profiles need Python 3.11+ (tomllib)")
+        with open(path, 'rb') as file:
+            data = tomllib.load(file)
+    elif ext == ".json":
+        with open(path, 'r') as file:
+            data = json.load(file)
+    else:
+        raise ValueError(f"Unsupported profile format: {ext} (use .json or .toml)")
+    return MachineProfile.from_dict(data, path)
+
+@functools.lru_cache(maxsize=PROFILE_CACHE_SIZE)
+def _cached_profile(profile):
+    return read_profile(os.path.abspath(profile_path(profile)))
+
+# A loaded profile by name, path or MachineProfile; None is DEFAULT_PROFILE.
+# Emitters call this for every section, so a lookup is a plain cache hit; edits to
+# a profile file are picked up after get_profile.cache_clear() (or a restart).
+def get_profile(profile=None):
+    if isinstance(profile, MachineProfile):
+        return profile
+    return _cached_profile(profile or DEFAULT_PROFILE)
+
+get_profile.cache_info = _cached_profile.cache_info
+get_profile.cache_clear = _cached_profile.cache_clear
+
+# Short name for file names; "" for the default profile
+def profile_tag(profile):
+    if profile is None or get_profile(profile).name == DEFAULT_PROFILE:
+        return ""
+    return "_" + get_profile(profile).name
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the program start a machine profile renders.")
+    parser.add_argument("profile", nargs="?", default=None, help=f"name or file (default: {DEFAULT_PROFILE})")
+    parser.add_argument("--list", action="store_true", help="list the profiles in machine_profiles/")
+    args = parser.parse_args(argv)
+    if args.list:
+        print("\n".join(list_profiles()))
+        return
+    profile = get_profile(args.profile)
+    print(f"{profile.name}: {profile.description}" if profile.description else profile.name)
+    print(profile.program_start + "...\n" + profile.footer, end="")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Travel-minimizing pass sequencer (direction="travel" in reorder_control_points_dual).
+
+Every pass ends with a retract to z_hold and an XY jog to the start of the next
+pass, so the order of passes and the end each one is entered from decide how much
+air time a program has. Passes are grouped into units (a single pass, or with
+symmetric=True the pair of passes mirrored about the centre line), the units are
+chained with a nearest-neighbour tour and the tour is improved with a windowed 2-opt.
+
+@author: kangputong
+"""
+
+from collections import defaultdict
+import numpy as np
+
+NN_RING_LIMIT = 3       # grid rings searched before a full nearest-endpoint scan
+TWO_OPT_WINDOW = 24     # passes considered ahead of each position by 2-opt
+TWO_OPT_SWEEPS = 3      # maximum improvement sweeps over the tour
+
+# XY jog lengths between consecutive passes of an ordered (2N, 2) point array
+def jog_lengths(ordered_pts):
+    ordered_pts = np.asarray(ordered_pts, dtype=float).reshape(-1, 2)
+    return np.linalg.norm(ordered_pts[2::2] - ordered_pts[1:-1:2], axis=1)
+
+def jog_length(ordered_pts):
+    return float(jog_lengths(ordered_pts).sum())
+
+# Group passes into units with a fixed internal traversal.
+# Returns a list of [(pass index, reversed), ...] plus the unit entry and exit points.
+def _build_units(pairs, free_entry, symmetric):
+    n = len(pairs)
+    if not symmetric:
+        units = [[(i, False)] for i in range(n)]
+        return units, pairs[:, 0].copy(), pairs[:, 1].copy()
+
+    units, starts, ends = [], [], []
+    for a in range((n + 1) // 2):
+        b = n - 1 - a
+        if a == b:
+            options = [[(a, False)]]
+        elif free_entry:
+            options = [[(a, ra), (b, rb)] for ra in (False, True) for rb in (False, True)]
+        else:
+            options = [[(a, False), (b, False)], [(b, False), (a, False)]]
+        # Keep the arrangement with the shortest jog inside the unit
+        best = min(options, key=lambda unit: _unit_inner_jog(pairs, unit))
+        units.append(best)
+        starts.append(_entry(pairs, best[0]))
+        ends.append(_exit(pairs, best[-1]))
+    return units, np.array(starts), np.array(ends)
+
+def _entry(pairs, step):
+    i, rev = step
+    return pairs[i, 1] if rev else pairs[i, 0]
+
+def _exit(pairs, step):
+    i, rev = step
+    return pairs[i, 0] if rev else pairs[i, 1]
+
+def _unit_inner_jog(pairs, unit):
+    return sum(np.hypot(*(_entry(pairs, b) - _exit(pairs, a))) for a, b in zip(unit, unit[1:]))
+
+# Greedy tour over units. Nearby endpoints are found with a uniform grid; when
+# nothing is within NN_RING_LIMIT cells (e.g. one_direction passes, where the next
+# start is on the far side) the free endpoints are searched all at once instead.
+# With free_entry a unit may be entered from its exit point, which reverses it.
+def _nearest_neighbour(starts, ends, free_entry):
+    n = len(starts)
+    pts = np.concatenate((starts, ends)) if free_entry else starts
+    lo = pts.min(axis=0)
+    cell = max(float((pts.max(axis=0) - lo).max()) / max(np.sqrt(n), 1.0), 1e-9)
+    keys = np.floor((pts - lo) / cell).astype(np.int64)
+    # Hatch endpoints sit on the outline, so shrink the cells until few share one
+    for _ in range(8):
+        per_cell = len(pts) / len(np.unique(keys, axis=0))
+        if per_cell <= 4:
+            break
+        cell /= np.sqrt(per_cell / 2)
+        keys = np.floor((pts - lo) / cell).astype(np.int64)
+    grid = defaultdict(list)
+    for k, key in enumerate(map(tuple, keys.tolist())):
+        grid[key].append(k)
+    pts_list = pts.tolist()
+    # Flat copy of the free endpoints for the full scan; taken ones are set to inf
+    # and the arrays are compacted once half of them are gone
+    free = {"x": pts[:, 0].copy(), "y": pts[:, 1].copy(), "k": np.arange(len(pts)),
+            "pos": np.arange(len(pts)), "taken": 0}
+
+    def take(unit):
+        for k in ((unit, unit + n) if free_entry else (unit,)):
+            grid[tuple(keys[k])].remove(k)
+            free["x"][free["pos"][k]] = np.inf
+            free["taken"] += 1
+        if free["taken"] * 2 > len(free["k"]):
+            keep = np.isfinite(free["x"])
+            for name in ("x", "y", "k"):
+                free[name] = free[name][keep]
+            free["pos"][free["k"]] = np.arange(len(free["k"]))
+            free["taken"] = 0
+
+    order, reverse = [0], [False]
+    take(0)
+    cur = ends[0]
+    for _ in range(n - 1):
+        ci, cj = np.floor((cur - lo) / cell).astype(np.int64)
+        best_k, best_d = -1, np.inf
+        for r in range(NN_RING_LIMIT + 1):
+            for di in range(-r, r + 1):
+                for dj in ((-r, r) if abs(di) != r else range(-r, r + 1)):
+                    for k in grid.get((ci + di, cj + dj), ()):
+                        px, py = pts_list[k]
+                        d = (px - cur[0]) ** 2 + (py - cur[1]) ** 2
+                        if d < best_d:
+                            best_k, best_d = k, d
+            # Points in later rings are at least r cells away
+            if best_k >= 0 and best_d <= (r * cell) ** 2:
+                break
+        else:
+            dx = free["x"] - cur[0]
+            dy = free["y"] - cur[1]
+            best_k = int(free["k"][np.argmin(dx * dx + dy * dy)])
+        unit, rev = best_k % n, best_k >= n
+        take(unit)
+        order.append(unit)
+        reverse.append(rev)
+        cur = starts[unit] if rev else ends[unit]
+    return np.array(order), np.array(reverse, dtype=bool)
+
+# Gain of reversing units i+1..i+k for every i at once (negative = shorter)
+def _two_opt_deltas(entry, exit_, k):
+    n = len(entry)
+    i = np.arange(n - 1 - k)
+    j = i + k
+    has_next = j + 1 < n
+    after = np.minimum(j + 1, n - 1)
+    old = (np.linalg.norm(exit_[i] - entry[i + 1], axis=1)
+           + np.where(has_next, np.linalg.norm(exit_[j] - entry[after], axis=1), 0.0))
+    new = (np.linalg.norm(exit_[i] - exit_[j], axis=1)
+           + np.where(has_next, np.linalg.norm(entry[i + 1] - entry[after], axis=1), 0.0))
+    return new - old
+
+# Windowed 2-opt: reversing the run of units i+1..j swaps their entry/exit points.
+# Each sweep first scores every move at once and only revisits positions that can improve.
+def _two_opt(entry, exit_, order, reverse, window=TWO_OPT_WINDOW, sweeps=TWO_OPT_SWEEPS):
+    n = len(order)
+    for _ in range(sweeps):
+        candidates = set()
+        for k in range(1, min(window, n - 2) + 1):
+            candidates.update(np.flatnonzero(_two_opt_deltas(entry, exit_, k) < -1e-9).tolist())
+        if not candidates:
+            break
+        for i in sorted(candidates):
+            j = np.arange(i + 1, min(i + window, n - 1) + 1)
+            if not len(j):
+                continue
+            after = np.minimum(j + 1, n - 1)
+            has_next = j + 1 < n
+            old = (np.linalg.norm(exit_[i] - entry[i + 1])
+                   + np.where(has_next, np.linalg.norm(exit_[j] - entry[after], axis=1), 0.0))
+            new = (np.linalg.norm(exit_[i] - exit_[j], axis=1)
+                   + np.where(has_next, np.linalg.norm(entry[i + 1] - entry[after], axis=1), 0.0))
+            m = int(np.argmin(new - old))
+            if new[m] - old[m] < -1e-9:
+                a, b = i + 1, j[m] + 1
+                order[a:b] = order[a:b][::-1]
+                reverse[a:b] = ~reverse[a:b][::-1]
+                entry[a:b], exit_[a:b] = exit_[a:b][::-1].copy(), entry[a:b][::-1].copy()
+    return order, reverse
+
+# Travel-minimizing order for (N, 2, 2) pairs whose passes already run pt1 -> pt2.
+# Returns the pass permutation and a mask of passes to run reversed.
+# free_entry=False keeps every pass in its given direction (one_direction mode);
+# symmetric=True cuts each pass together with its mirror about the centre line.
+def travel_order(pairs, free_entry=True, symmetric=False):
+    pairs = np.asarray(pairs, dtype=float).reshape(-1, 2, 2)
+    if len(pairs) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=bool)
+    units, starts, ends = _build_units(pairs, free_entry, symmetric)
+    order, reverse = _nearest_neighbour(starts, ends, free_entry)
+    if free_entry:
+        entry = np.where(reverse[:, None], ends[order], starts[order])
+        exit_ = np.where(reverse[:, None], starts[order], ends[order])
+        order, reverse = _two_opt(entry, exit_, order, reverse)
+
+    steps = []
+    for unit, rev in zip(order.tolist(), reverse.tolist()):
+        seq = units[unit]
+        steps.extend([(i, not r) for i, r in reversed(seq)] if rev else seq)
+    pass_idx, flip = zip(*steps)
+    return np.array(pass_idx, dtype=np.intp), np.array(flip, dtype=bool)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Tolerance-driven point reduction for toolpath moves.
+
+Runs on the (n, 3) move blocks produced by toolpath_moves, right before they are
+formatted, so every emitter that writes move blocks can use it:
+  - exact merge (always): repeated points and interior points of straight,
+    non-reversing runs are dropped; the path is unchanged
+  - Ramer-Douglas-Peucker (tolerance > 0): inside each cutting run (consecutive
+    points with Z <= 0) points are dropped while every removed point stays within
+    tolerance [mm] of the chord that replaces it. Air moves, plunges and retracts
+    are never simplified, so clearance moves stay exactly as generated.
+
+RDP is run level by level: every open interval is split at its farthest point in
+the same vectorized step, so the work per level is O(n).
+
+Fewer, longer blocks also keep the controller's look-ahead from starving.
+
+@author: kangputong
+"""
+
+import numpy as np
+
+COLLINEAR_TOL = 1e-6    # [mm] deviation treated as straight by the exact merge
+
+# Distance of each point to the segment a -> b (rows broadcast)
+def _segment_distance(pts, a, b):
+    ab = b - a
+    denom = np.einsum('ij,ij->i', ab, ab)
+    t = np.einsum('ij,ij->i', pts - a, ab) / np.where(denom > 0, denom, 1.0)
+    closest = a + np.clip(t, 0.0, 1.0)[:, None] * ab
+    return np.linalg.norm(pts - closest, axis=1)
+
+# Keep mask that drops repeated points and interior points of straight runs
+def collinear_mask(pts, tol=COLLINEAR_TOL):
+    pts = np.asarray(pts, dtype=float)
+    keep = np.ones(len(pts), dtype=bool)
+    if len(pts) < 2:
+        return keep
+    keep[1:] = np.any(pts[1:] != pts[:-1], axis=1)
+    idx = np.flatnonzero(keep)
+    if len(idx) < 3:
+        return keep
+    p = pts[idx]
+    prev, mid, nxt = p[:-2], p[1:-1], p[2:]
+    straight = ((_segment_distance(mid, prev, nxt) <= tol)
+                & (np.einsum('ij,ij->i', mid - prev, nxt - mid) > 0))
+    keep[idx[1:-1][straight]] = False
+    return keep
+
+# Keep mask of a level-synchronous RDP; fixed points are always kept and split the
+# polyline into independent runs
+def rdp_mask(pts, tolerance, fixed=None):
+    pts = np.asarray(pts, dtype=float)
+    n = len(pts)
+    keep = np.zeros(n, dtype=bool) if fixed is None else np.array(fixed, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    cand = np.flatnonzero(~keep)
+    while len(cand):
+        kept = np.flatnonzero(keep)
+        seg = np.searchsorted(kept, cand) - 1
+        dist = _segment_distance(pts[cand], pts[kept[seg]], pts[kept[seg + 1]])
+        # Farthest point of every interval at once
+        starts = np.flatnonzero(np.r_[True, seg[1:] != seg[:-1]])
+        far = np.maximum.reduceat(dist, starts)
+        group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(cand)]))
+        is_far = (dist == far[group]) & (far[group] > tolerance)
+        first_far = np.unique(group[is_far], return_index=True)[1]
+        split = cand[np.flatnonzero(is_far)[first_far]]
+        keep[split] = True
+        # Intervals within tolerance are settled; the rest go one level down
+        cand = cand[(far[group] > tolerance) & ~keep[cand]]
+    return keep
+
+# Keep mask for one move block: exact merge everywhere, RDP inside cutting runs
+def reduce_mask(xyz, tolerance=0.0):
+    xyz = np.asarray(xyz, dtype=float)
+    keep = collinear_mask(xyz)
+    if tolerance > 0 and len(xyz) > 2:
+        idx = np.flatnonzero(keep)
+        pts = xyz[idx]
+        in_sheet = pts[:, 2] <= 0
+        # Everything outside the sheet and both ends of each cutting run stay
+        fixed = ~in_sheet
+        fixed[1:] |= in_sheet[1:] & ~in_sheet[:-1]
+        fixed[:-1] |= in_sheet[:-1] & ~in_sheet[1:]
+        # Sharp turns (> 90 deg between moves longer than the tolerance) are kept
+        # anyway; fixing them up front keeps RDP from recursing one corner at a time
+        d = np.diff(pts, axis=0)
+        long_move = np.linalg.norm(d, axis=1) > tolerance
+        fixed[1:-1] |= (np.einsum('ij,ij->i', d[:-1], d[1:]) < 0) & long_move[:-1] & long_move[1:]
+        keep[idx[~rdp_mask(pts, tolerance, fixed)]] = False
+    return keep
+
+def new_reduction_stats():
+    return {"points_in": 0, "points_out": 0, "bytes_removed": 0}
+
+# Reduce a stream of move blocks. Block ends are kept so blocks stay independent.
+# When stats is given it collects point counts and, through formatter, the bytes
+# the dropped lines would have taken.
+def reduce_move_blocks(blocks, tolerance=0.0, stats=None, formatter=None):
+    for xyz in blocks:
+        keep = reduce_mask(xyz, tolerance)
+        if stats is not None:
+            stats["points_in"] += len(keep)
+            stats["points_out"] += int(keep.sum())
+            if formatter is not None and not keep.all():
+                stats["bytes_removed"] += len(formatter(np.asarray(xyz)[~keep]))
+        yield np.asarray(xyz)[keep]
+
+# One-line summary; file_size is the size of the reduced program
+def format_reduction(stats, file_size=None):
+    removed = stats["points_in"] - stats["points_out"]
+    share = removed / stats["points_in"] if stats["points_in"] else 0.0
+    text = f"Points: {stats['points_in']:,} -> {stats['points_out']:,} (-{share:.1%})"
+    if file_size is not None:
+        before = file_size + stats["bytes_removed"]
+        text += f", file: {before / 1e6:.2f} -> {file_size / 1e6:.2f} MB (-{stats['bytes_removed'] / max(before, 1):.1%})"
+    return text
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Texture hatching on arbitrary polygon regions.
+
+A region is a list of closed rings: the outer outline first, then any holes
+(orientation does not matter, the even-odd rule decides what is inside), so
+concave outlines and holes give several segments on one hatch line. The
+segments come out as the same (N, 2, 2) pair array generate_control_pairs
+returns, ready for reorder_control_points_dual and write_Gcodes.
+
+All hatch lines are clipped at once with an edge table instead of testing every
+line against every edge: in a frame rotated so the hatch lines are horizontal,
+each edge only crosses the lines between its two end offsets, so its first line
+and crossing count follow directly from the offsets. The crossings are expanded
+in one pass and sorted by (line, position along the line), which pairs them into
+inside segments. Cost is O(E + C log C) for E edges and C crossings, about two
+per hatch line and region boundary it passes.
+
+Region file (JSON):
+    {"outer": [[0, 0], [400, 0], [400, 300], [0, 300]],
+     "holes": [[[150, 100], [250, 100], [250, 200], [150, 200]]]}
+
+Usage:
+    python polygon_region.py region.json --sp 0.5 --angle 45 --thinning 0.2 --z-hold 2.0 -o out.txt [--profile NAME]
+
+@author: kangputong
+"""
+
+import argparse
+import functools
+import json
+import math
+import numpy as np
+from texture_dual import PAIR_CACHE_SIZE, reorder_control_points_dual, write_Gcodes
+
+# Normalize a region to a list of (k, 2) rings without the repeated closing point.
+# Accepts {"outer": ring, "holes": [ring, ...]}, a list of rings, or a single ring.
+def as_rings(region):
+    if isinstance(region, dict):
+        rings = [region["outer"]] + list(region.get("holes", []))
+    elif np.ndim(region[0]) == 1:
+        rings = [region]
+    else:
+        rings = list(region)
+    out = []
+    for ring in rings:
+        ring = np.asarray(ring, dtype=float).reshape(-1, 2)
+        if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+            ring = ring[:-1]
+        if len(ring) < 3:
+            raise ValueError(f"A region ring needs at least 3 points, got {len(ring)}")
+        out.append(ring)
+    return out
+
+def load_region(file_path):
+    with open(file_path, 'r') as file:
+        return as_rings(json.load(file))
+
+# (E, 2, 2) array of every ring edge
+def region_edges(rings):
+    return np.concatenate([np.stack((ring, np.roll(ring, -1, axis=0)), axis=1) for ring in rings])
+
+# Bounding box corners, used as ini_pt / fin_pt by write_Gcodes (the bottom tool
+# parks at the box centre)
+def region_bounds(rings):
+    pts = np.concatenate(rings)
+    return pts.min(axis=0).tolist(), pts.max(axis=0).tolist()
+
+# Hatch segments of a region at angle_deg with line spacing sp, as (N, 2, 2) pairs.
+# Lines use the same offsets as generate_control_pairs; segments are ordered by
+# line, then along the line direction.
+def hatch_region(rings, angle_deg, sp):
+    theta = math.radians(angle_deg)
+    dir_vec = np.array([np.cos(theta), np.sin(theta)])
+    normal_vec = np.array([-dir_vec[1], dir_vec[0]])
+
+    edges = region_edges(rings)
+    s = edges @ normal_vec      # (E, 2) line offset of each edge end
+    t = edges @ dir_vec         # (E, 2) position along the lines
+    min_proj, max_proj = s.min(), s.max()
+    num_lines = int((max_proj - min_proj) / sp) + 1
+
+    # Edge table: edge e crosses lines first[e] .. first[e] + count[e] - 1, i.e. the
+    # offsets in [low end, high end). The half-open range counts a vertex for exactly
+    # one of its two edges, so every line sees an even number of crossings.
+    first = np.ceil((s.min(axis=1) - min_proj) / sp).astype(np.int64)
+    stop = np.minimum(np.ceil((s.max(axis=1) - min_proj) / sp).astype(np.int64), num_lines)
+    count = np.maximum(stop - first, 0)
+    total = int(count.sum())
+    if total == 0:
+        return np.empty((0, 2, 2))
+
+    edge_idx = np.repeat(np.arange(len(edges)), count)
+    line_idx = first[edge_idx] + np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+    offsets = min_proj + line_idx * sp
+    s0, s1 = s[edge_idx, 0], s[edge_idx, 1]
+    t0, t1 = t[edge_idx, 0], t[edge_idx, 1]
+    pos = t0 + (offsets - s0) / (s1 - s0) * (t1 - t0)
+
+    # Sorted along each line, crossings alternate entering / leaving the region
+    order = np.lexsort((pos, line_idx))
+    pos = pos[order].reshape(-1, 2)
+    offsets = offsets[order][0::2]
+    keep = pos[:, 1] - pos[:, 0] > 1e-9 * max(1.0, abs(max_proj - min_proj))
+    pos, offsets = pos[keep], offsets[keep]
+
+    base = offsets[:, None] * normal_vec
+    return np.stack((base + pos[:, :1] * dir_vec, base + pos[:, 1:] * dir_vec), axis=1)
+
+# Memoized hatch_region, keyed on the ring coordinates (see cached_control_pairs)
+@functools.lru_cache(maxsize=PAIR_CACHE_SIZE)
+def _cached_region_pairs(ring_key, angle_deg, sp):
+    pairs = hatch_region([np.array(ring) for ring in ring_key], angle_deg, sp)
+    pairs.flags.writeable = False
+    return pairs
+
+def cached_region_pairs(rings, angle_deg, sp):
+    ring_key = tuple(tuple(map(tuple, ring.tolist())) for ring in as_rings(rings))
+    return _cached_region_pairs(ring_key, float(angle_deg), float(sp))
+
+cached_region_pairs.cache_info = _cached_region_pairs.cache_info
+cached_region_pairs.cache_clear = _cached_region_pairs.cache_clear
+
+# Full pipeline for one region: hatch -> reorder -> write
+def write_region_gcode(rings, file_path, angle_deg, sp, thinning_t, z_hold,
+                       mode="one_direction", direction="travel", profile=None):
+    pairs = cached_region_pairs(rings, angle_deg, sp)
+    if len(pairs) == 0:
+        raise ValueError(f"No hatch line crosses the region (spacing {sp:g} mm)")
+    ordered_pts = reorder_control_points_dual(pairs, mode=mode, direction=direction)
+    ini_pt, fin_pt = region_bounds(as_rings(rings))
+    write_Gcodes(ordered_pts, file_path, ini_pt, fin_pt, thinning_t, z_hold, profile=profile)
+    return len(pairs)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate texture G-code for a polygon region.")
+    parser.add_argument("region", help="region file (.json with outer / holes rings)")
+    parser.add_argument("--sp", type=float, required=True, help="spacing [mm]")
+    parser.add_argument("--angle", type=float, default=0.0, help="angle [deg]")
+    parser.add_argument("--thinning", type=float, required=True, help="thinning from the top")
+    parser.add_argument("--z-hold", type=float, required=True, help="z_hold [mm]")
+    parser.add_argument("--mode", default="one_direction", choices=("one_direction", "zig_zag"))
+    parser.add_argument("--direction", default="travel", choices=("inward", "outward", "travel"))
+    parser.add_argument("-o", "--output", default="region_texture.txt", help="program file")
+    parser.add_argument("--profile", default=None, help="machine profile name or file")
+    args = parser.parse_args(argv)
+
+    rings = load_region(args.region)
+    passes = write_region_gcode(rings, args.output, args.angle, args.sp, args.thinning, args.z_hold,
+                                args.mode, args.direction, args.profile)
+    print(f"{passes} passes -> {args.output}")
+
+if __name__ == "__main__":
+    main()
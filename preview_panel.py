@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Live hatch preview embedded in the TextureGUI window.
+
+Every input change restarts a short debounce timer; when it runs out the current
+inputs are sent to a preview worker thread, which builds the pass pattern and
+hands back ready-to-draw line arrays. Each request carries a generation number:
+a request that is superseded before it starts is cancelled, and a result whose
+generation is no longer the latest is dropped, so the canvas only ever shows the
+newest inputs.
+
+The hatch geometry comes from cached_control_pairs (keyed on location, angle and
+spacing) and the last ordering is kept, so changing mode, direction, thinning or
+z_hold reuses the work already done. Axes and grid are drawn once into a cached
+background (again only when the location changes); an update restores it, draws
+the cut and jog lines (one artist each, NaN-separated) and blits the axes. Above
+MAX_DRAWN_PASSES, about one pass per pixel, only every k-th pass is drawn, which
+keeps a redraw within the interactive budget (DRAW_BUDGET_MS) at any spacing.
+
+@author: kangputong
+"""
+
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from texture_dual import texture_bounds, cached_control_pairs, reorder_control_points_dual
+from job_runner import POLL_MS
+
+DEBOUNCE_MS = 150       # quiet time after the last keystroke before regenerating
+MAX_DRAWN_PASSES = 400  # passes drawn at most; finer hatches show every k-th pass
+DRAW_BUDGET_MS = 50     # target time of one redraw
+PLOT_MARGIN = 3.0       # [mm] around the patch
+
+# Ready-to-draw NaN-separated cut and jog polylines for ordered control points
+def preview_lines(ordered_pts, max_passes=MAX_DRAWN_PASSES):
+    pts = np.asarray(ordered_pts, dtype=float).reshape(-1, 2, 2)
+    step = max(1, -(-len(pts) // max_passes))
+    shown = pts[::step]
+    gap = np.full((len(shown), 1, 2), np.nan)
+    cuts = np.concatenate([shown, gap], axis=1).reshape(-1, 2)
+    if step == 1 and len(pts) > 1:
+        # Air moves between passes, only meaningful when every pass is drawn
+        jogs = np.concatenate([pts[:-1, 1:2], pts[1:, 0:1], gap[:len(pts) - 1]], axis=1).reshape(-1, 2)
+    else:
+        jogs = np.empty((0, 2))
+    return cuts, jogs, step
+
+# Preview inputs read from the widgets; raises ValueError while they are incomplete
+class PreviewRequest:
+    def __init__(self, loc, sp, angle, mode, direction):
+        self.loc = loc
+        self.sp = float(sp)
+        self.angle = float(angle)
+        self.mode = mode
+        self.direction = direction
+        if self.sp <= 0:
+            raise ValueError("spacing must be positive")
+
+    @property
+    def order_key(self):
+        return self.loc, self.sp, self.angle, self.mode, self.direction
+
+class PathPreview:
+    def __init__(self, root, parent, width=4.0, height=3.6):
+        self.root = root
+        self.figure = Figure(figsize=(width, height), dpi=80)
+        self.ax = self.figure.add_subplot(111)
+        self.ax.grid(True)
+        self.jog_line, = self.ax.plot([], [], '-', color="0.75", linewidth=0.6, animated=True)
+        self.cut_line, = self.ax.plot([], [], 'b-', linewidth=0.8, animated=True)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=parent)
+        self.widget = self.canvas.get_tk_widget()
+        self.info_label = ttk.Label(parent, text="", font=("Arial", 9))
+        self.canvas.mpl_connect('draw_event', self._save_background)
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview")
+        self.results = queue.Queue()
+        self.generation = 0
+        self.future = None
+        self.after_id = None
+        self.last_order = None      # (order_key, ordered_pts) of the last request
+        self.bounds = None
+        self.background = None
+        self.draw_ms = 0.0
+        self.root.after(POLL_MS, self.poll)
+
+    # Restart the debounce timer; read_request() is called once the input settles
+    def schedule(self, read_request):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        self.after_id = self.root.after(DEBOUNCE_MS, lambda: self._submit(read_request))
+
+    def _submit(self, read_request):
+        self.after_id = None
+        try:
+            request = read_request()
+        except (TypeError, ValueError) as exc:
+            self.info_label.config(text=f"Preview: {exc}")
+            return
+        self.generation += 1
+        if self.future is not None:
+            self.future.cancel()    # not started yet: no point computing it
+        self.future = self.executor.submit(self._compute, self.generation, request)
+
+    # Worker thread
+    def _compute(self, generation, request):
+        start = time.perf_counter()
+        try:
+            bounds = texture_bounds(request.loc)
+            cached = self.last_order
+            if cached is not None and cached[0] == request.order_key:
+                ordered_pts = cached[1]
+            else:
+                pairs = cached_control_pairs(bounds[0], bounds[1], request.angle, request.sp)
+                if generation != self.generation:
+                    return
+                ordered_pts = (reorder_control_points_dual(pairs, mode=request.mode, direction=request.direction)
+                               if len(pairs) else np.empty((0, 2)))
+                self.last_order = (request.order_key, ordered_pts)
+            lines = preview_lines(ordered_pts)
+        except Exception as exc:
+            self.results.put((generation, exc))
+            return
+        self.results.put((generation, (lines, bounds, len(ordered_pts) // 2, time.perf_counter() - start)))
+
+    # Tk thread: draw the newest result, drop the stale ones
+    def poll(self):
+        try:
+            latest = None
+            while True:
+                generation, result = self.results.get_nowait()
+                if generation == self.generation:
+                    latest = result
+        except queue.Empty:
+            if latest is not None:
+                self._show(latest)
+        finally:
+            self.root.after(POLL_MS, self.poll)
+
+    def _show(self, result):
+        if isinstance(result, Exception):
+            self.info_label.config(text=f"Preview: {result}")
+            return
+        (cuts, jogs, step), bounds, num_passes, compute_s = result
+        start = time.perf_counter()
+        self.cut_line.set_data(cuts[:, 0], cuts[:, 1])
+        self.jog_line.set_data(jogs[:, 0], jogs[:, 1])
+        if bounds != self.bounds or self.background is None:
+            # New patch location: full redraw, the draw event refreshes the background
+            (x0, y0), (x1, y1) = bounds
+            self.ax.set_xlim(min(x0, x1) - PLOT_MARGIN, max(x0, x1) + PLOT_MARGIN)
+            self.ax.set_ylim(min(y0, y1) - PLOT_MARGIN, max(y0, y1) + PLOT_MARGIN)
+            self.bounds = bounds
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self._draw_lines()
+            self.canvas.blit(self.ax.bbox)
+        self.draw_ms = 1000 * (time.perf_counter() - start)
+        shown = f", 1 in {step} shown" if step > 1 else ""
+        self.info_label.config(text=f"{num_passes:,} passes{shown} | build {compute_s * 1000:.0f} ms, "
+                                    f"draw {self.draw_ms:.0f} ms")
+
+    def _draw_lines(self):
+        self.ax.draw_artist(self.jog_line)
+        self.ax.draw_artist(self.cut_line)
+
+    # Full redraws (first show, resize, new location) save the bare axes and then
+    # paint the current lines over them
+    def _save_background(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_lines()
+        self.canvas.blit(self.ax.bbox)
+
+    def close(self):
+        self.generation += 1
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight stage timers and counters for the generation pipeline.
+
+The pipeline functions are wrapped with @profiled("stage") and bump counters with
+PROFILER.count(...). While the profiler is disabled (the default) a wrapped call
+costs one attribute check and count() returns at once, so the hooks can stay in
+the hot paths.
+
+    PROFILER.enable()
+    with PROFILER.run("generate"):
+        ...                                  # wrapped calls are timed and counted
+    print(PROFILER.summary())                # one line, e.g. for a status bar
+
+Stage times are inclusive (a visualize stage contains its parse). Each run writes
+a JSON report into report_dir (default ~/.ampl_profiles). While a run is open only
+the thread that opened it is recorded, so work on other threads (e.g. the live
+preview) does not count toward the run.
+
+Stages: generate, reorder, write, parse, expand, dialog, visualize, export
+Counters: lines_generated, points_written, bytes_written, moves_parsed, bytes_parsed,
+          moves_expanded
+
+@author: kangputong
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+DEFAULT_REPORT_DIR = os.path.join(os.path.expanduser("~"), ".ampl_profiles")
+
+class Profiler:
+    def __init__(self, report_dir=DEFAULT_REPORT_DIR):
+        self.enabled = False
+        self.report_dir = report_dir
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._run_thread = None     # thread of the open run, None outside runs
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    # True outside runs and on the thread of the open run
+    def on_run_thread(self):
+        run_thread = self._run_thread
+        return run_thread is None or run_thread is threading.current_thread()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}        # name -> [calls, total_s, max_s]
+            self.counters = {}
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def count(self, name, amount=1):
+        if not self.enabled or not self.on_run_thread():
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled or not self.on_run_thread():
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.on_run_thread():    # a run may have opened on another thread meanwhile
+                self.add_time(name, time.perf_counter() - start)
+
+    # One user action: counters start from zero and a report is kept and written
+    @contextmanager
+    def run(self, label):
+        if not self.enabled:
+            yield
+            return
+        self.reset()
+        self._run_thread = threading.current_thread()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._run_thread = None
+            self.last_report = self.report(label, time.perf_counter() - start)
+            self.write_report(self.last_report)
+
+    def report(self, label="run", total_s=None):
+        with self._lock:
+            stages = {name: {"calls": calls, "total_s": total, "max_s": peak}
+                      for name, (calls, total, peak) in self.stages.items()}
+            counters = dict(self.counters)
+        rates = {}
+        if "write" in stages and counters.get("bytes_written"):
+            rates["write_mb_per_s"] = counters["bytes_written"] / 1e6 / max(stages["write"]["total_s"], 1e-9)
+        if "parse" in stages and counters.get("bytes_parsed"):
+            rates["parse_mb_per_s"] = counters["bytes_parsed"] / 1e6 / max(stages["parse"]["total_s"], 1e-9)
+        if "parse" in stages and counters.get("moves_parsed"):
+            rates["parse_moves_per_s"] = counters["moves_parsed"] / max(stages["parse"]["total_s"], 1e-9)
+        return {"label": label, "date": datetime.now().isoformat(timespec="seconds"),
+                "total_s": total_s, "stages": stages, "counters": counters, "rates": rates}
+
+    def write_report(self, report):
+        if not self.report_dir:
+            return None
+        path = os.path.join(self.report_dir, f"{report['label']}_{datetime.now():%Y%m%d-%H%M%S-%f}.json")
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            with open(path, 'w') as file:
+                json.dump(report, file, indent=1)
+        except OSError:
+            return None
+        return path
+
+    # Short one-line summary of the last run (or the stages so far)
+    def summary(self, report=None):
+        report = report or self.last_report or self.report()
+        parts = [f"{name} {_format_seconds(entry['total_s'])}" for name, entry in report["stages"].items()]
+        counters = report["counters"]
+        if counters.get("lines_generated"):
+            parts.append(f"{counters['lines_generated']:,} lines")
+        if counters.get("points_written"):
+            parts.append(f"{counters['points_written']:,} pts")
+        if counters.get("bytes_written"):
+            parts.append(f"{counters['bytes_written'] / 1e6:.1f} MB written")
+        if "parse_moves_per_s" in report["rates"]:
+            parts.append(f"{report['rates']['parse_moves_per_s'] / 1e6:.1f} M moves/s parsed")
+        if report.get("total_s") is not None:
+            parts.append(f"total {_format_seconds(report['total_s'])}")
+        return " | ".join(parts)
+
+def _format_seconds(seconds):
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+PROFILER = Profiler()
+
+# Decorator timing every call of a function as stage `name` while profiling is on
+def profiled(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled or not PROFILER.on_run_thread():
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if PROFILER.on_run_thread():
+                    PROFILER.add_time(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Regression tests for the skipped identical start of toolpath_diff.
+
+With a tiny block size the first change falls in a line that crosses a block
+boundary, and a line without Y (which the parser drops) sits in the identical
+start.
+"""
+
+import pytest
+from toolpath_diff import common_prefix, diff_programs
+
+HEADER = "DELGAT \nOPEN PROG 2 \nX 0.0000 Y 0.0000 Z 80.0000 U 0.0000 V 0.0000 W -80.0000 F 5.0000 \n"
+CHANGED_LINE = 25
+
+def _lines():
+    lines = [f"X {i:.4f} Y {2 * i:.4f} Z 1.0000 U 0.0000 V 0.0000 W 0.0000\n" for i in range(40)]
+    lines[3] = "X 3.0000 Z 1.0000\n"
+    return lines
+
+def _write(path, lines):
+    path.write_text(HEADER + "".join(lines) + "CLOSE ALL\n")
+    return str(path)
+
+@pytest.fixture
+def programs(tmp_path):
+    lines = _lines()
+    changed = list(lines)
+    changed[CHANGED_LINE] = lines[CHANGED_LINE].replace("Z 1.0000", "Z 1.5000")
+    return _write(tmp_path / "a.txt", lines), _write(tmp_path / "b.txt", changed), lines
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 7, 11, 64, 4096])
+def test_prefix_stops_at_the_changed_line(programs, block_size):
+    path_a, path_b, lines = programs
+    offset, moves = common_prefix(path_a, path_b, block_size)
+    assert offset == len(HEADER) + sum(map(len, lines[:CHANGED_LINE]))
+    # The home move plus every line before the change except the one without Y
+    assert moves == 1 + CHANGED_LINE - 1
+
+@pytest.mark.parametrize("block_size", [1, 7, 4096])
+def test_change_in_a_boundary_line_is_reported(programs, block_size):
+    path_a, path_b, _ = programs
+    report = diff_programs(path_a, path_b, prefix_block=block_size)
+    assert not report["identical"]
+    assert report["first_divergence"]["index_a"] == CHANGED_LINE
+    assert report["changed"] == 1
+
+def test_identical_programs_are_skipped_whole(programs):
+    path_a, _, _ = programs
+    report = diff_programs(path_a, path_a, prefix_block=7)
+    assert report["identical"]
+    assert report["moves_a"] == report["skipped"] == 40
@@ -1,7 +1,16 @@
 import os
+import functools
 import numpy as np
 import math
 from datetime import datetime
+from gcode_writer import GcodeWriter, toolpath_moves
+from machine_profile import DEFAULT_PROFILE, get_profile
+from pass_sequencer import travel_order, jog_lengths
+from cycle_estimator import move_times
+from point_reduction import reduce_move_blocks, new_reduction_stats
+from stage_profiler import PROFILER, profiled
+
+PAIR_CACHE_SIZE = 64   # geometries kept by cached_control_pairs
 
 class Initializer:
     def __init__(self):
@@ -18,7 +27,11 @@ class Initializer:
         self.angle = None
         self.z_hold = None
         self.mode = None
+        self.direction = None
         self.flag = None
+        self.tolerance = None           # point reduction tolerance [mm], None = off
+        self.bottom = "park"            # bottom tool strategy (see dual_tool)
+        self.profile = DEFAULT_PROFILE  # machine profile name
 
     def initialize(self):
         # Collect input from user through console
@@ -32,26 +45,30 @@ class Initializer:
         self.flag = input("Enter texture method (inward or outward): ") or "outward"
 
     def set_texture_bounds(self):
-        # Calculate initial and final point coordinates based on location number
-        texture_w = 50
-        length = 250
-        x_coord = length / 4 - texture_w / 2
-        y_coord = length / 4 - texture_w / 2
-
-        if self.loc == "1":
-            self.ini_pt = [x_coord, y_coord]
-            self.fin_pt = [x_coord + texture_w, y_coord + texture_w]
-        elif self.loc == "2":
-            self.ini_pt = [-x_coord - texture_w, y_coord]
-            self.fin_pt = [-x_coord, y_coord + texture_w]
-        elif self.loc == "3":
-            self.ini_pt = [-(x_coord + texture_w), -(y_coord + texture_w)]
-            self.fin_pt = [-x_coord, -y_coord]
-        elif self.loc == "4":
-            self.ini_pt = [x_coord, -(y_coord + texture_w)]
-            self.fin_pt = [x_coord + texture_w, -y_coord]
-        else:
-            raise ValueError("Invalid location number (should be 1–4)") 
+        self.ini_pt, self.fin_pt = texture_bounds(self.loc)
+
+# Initial and final point coordinates of the texture patch at a location number
+def texture_bounds(loc):
+    texture_w = 50
+    length = 250
+    x_coord = length / 4 - texture_w / 2
+    y_coord = length / 4 - texture_w / 2
+
+    if loc == "1":
+        ini_pt = [x_coord, y_coord]
+        fin_pt = [x_coord + texture_w, y_coord + texture_w]
+    elif loc == "2":
+        ini_pt = [-x_coord - texture_w, y_coord]
+        fin_pt = [-x_coord, y_coord + texture_w]
+    elif loc == "3":
+        ini_pt = [-(x_coord + texture_w), -(y_coord + texture_w)]
+        fin_pt = [-x_coord, -y_coord]
+    elif loc == "4":
+        ini_pt = [x_coord, -(y_coord + texture_w)]
+        fin_pt = [x_coord + texture_w, -y_coord]
+    else:
+        raise ValueError("Invalid location number (should be 1–4)") 
+    return ini_pt, fin_pt
 
 # Compute the intersection between a given line and the square edges
 def line_square_intersections(p0, dir_vec, x_min, x_max, y_min, y_max):
@@ -75,7 +92,50 @@ def line_square_intersections(p0, dir_vec, x_min, x_max, y_min, y_max):
             continue
     return hits if len(hits) == 2 else []
 
+# Clip a whole batch of parallel hatch lines against the square edges at once.
+# All lines share dir_vec, so each edge is one 2x2 system broadcast over N lines;
+# solving it as a stack gives bit-identical hits to line_square_intersections.
+def _edge_hits(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max):
+    offsets = np.asarray(offsets, dtype=float)
+    p0 = offsets[:, None] * normal_vec
+    square_edges = [
+        (np.array([x_min, y_min]), np.array([x_max, y_min])),
+        (np.array([x_max, y_min]), np.array([x_max, y_max])),
+        (np.array([x_max, y_max]), np.array([x_min, y_max])),
+        (np.array([x_min, y_max]), np.array([x_min, y_min])),
+    ]
+    hit_mask = np.zeros((len(offsets), 4), dtype=bool)
+    hit_pts = np.zeros((len(offsets), 4, 2))
+    for k, (p1, p2) in enumerate(square_edges):
+        seg_dir = p2 - p1
+        A = np.column_stack((dir_vec, -seg_dir))
+        b = (p1 - p0)[..., None]
+        try:
+            t1, t2 = np.linalg.solve(np.broadcast_to(A, (len(offsets), 2, 2)), b)[..., 0].T
+        except np.linalg.LinAlgError:
+            continue
+        hit_mask[:, k] = (0 <= t2) & (t2 <= 1)
+        hit_pts[:, k] = p0 + t1[:, None] * dir_vec
+    return hit_mask, hit_pts
+
+# Which lines clip_lines_to_rectangle keeps (exactly two edge hits)
+def clipped_line_mask(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max):
+    hit_mask, _ = _edge_hits(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max)
+    return hit_mask.sum(axis=1) == 2
+
+def clip_lines_to_rectangle(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max):
+    hit_mask, hit_pts = _edge_hits(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max)
+
+    # Keep only lines with exactly two hits, in edge order like the scalar version
+    keep = hit_mask.sum(axis=1) == 2
+    hit_mask, hit_pts = hit_mask[keep], hit_pts[keep]
+    first = np.argmax(hit_mask, axis=1)
+    second = 3 - np.argmax(hit_mask[:, ::-1], axis=1)
+    rows = np.arange(len(hit_pts))
+    return np.stack((hit_pts[rows, first], hit_pts[rows, second]), axis=1)
+
 # Generate pairs of control points based on lines intersecting the square
+@profiled("generate")
 def generate_control_pairs(ini_pt, fin_pt, angle_deg, sp):
     theta = math.radians(angle_deg)
     dir_vec = np.array([np.cos(theta), np.sin(theta)])
@@ -94,101 +154,188 @@ def generate_control_pairs(ini_pt, fin_pt, angle_deg, sp):
     min_proj, max_proj = projections.min(), projections.max()
     num_lines = int((max_proj - min_proj) / sp) + 1
 
-    x_min, y_min = min(ini_pt[0], fin_pt[0]), min(ini_pt[1], fin_pt[1])
-    x_max, y_max = max(ini_pt[0], fin_pt[0]), max(ini_pt[1], fin_pt[1])
+    # (N, 2, 2) array of endpoint pairs, one row per hatch line crossing the square
+    offsets = min_proj + np.arange(num_lines) * sp
+    pairs = clip_lines_to_rectangle(offsets, dir_vec, normal_vec, x_min, x_max, y_min, y_max)
+    PROFILER.count("lines_generated", len(pairs))
+    return pairs
 
-    intersections = []
-    for i in range(num_lines):
-        offset = min_proj + i * sp
-        p0 = offset * normal_vec
-        points = line_square_intersections(p0, dir_vec, x_min, x_max, y_min, y_max)
-        if len(points) == 2:
-            intersections.append(points)
+# Memoized front of generate_control_pairs. The geometry only depends on the bounds,
+# angle and spacing, so thinning / z_hold / mode / direction variants share one
+# read-only array. Stats: cached_control_pairs.cache_info()
+@functools.lru_cache(maxsize=PAIR_CACHE_SIZE)
+def _cached_pairs(ini_pt, fin_pt, angle_deg, sp):
+    pairs = generate_control_pairs(ini_pt, fin_pt, angle_deg, sp)
+    pairs.flags.writeable = False
+    return pairs
 
-    return intersections
+def cached_control_pairs(ini_pt, fin_pt, angle_deg, sp):
+    return _cached_pairs(tuple(map(float, ini_pt)), tuple(map(float, fin_pt)), float(angle_deg), float(sp))
 
-def reorder_control_points_dual(pairs, mode="one_direction", direction="inward"):
-    num_pairs = len(pairs)
+cached_control_pairs.cache_info = _cached_pairs.cache_info
+cached_control_pairs.cache_clear = _cached_pairs.cache_clear
 
-    # Determine pair sequence
+# Pair sequence as one index permutation
+def pass_order(num_pairs, direction="inward"):
+    return pass_order_slice(num_pairs, direction)
+
+# Positions start..stop of the pair sequence. Every pair index follows from its
+# position alone, so a long sequence can be produced chunk by chunk.
+def pass_order_slice(num_pairs, direction="inward", start=0, stop=None):
+    stop = num_pairs if stop is None else min(stop, num_pairs)
+    pos = np.arange(start, max(stop, start), dtype=np.intp)
     if direction == "inward":
-        # From ends to center (original logic)
-        ordered_indices = []
-        for i in range((num_pairs + 1) // 2):
-            ordered_indices.append(i)
-            if i != num_pairs - 1 - i:
-                ordered_indices.append(num_pairs - 1 - i)
+        # From ends to center (original logic): 0, N-1, 1, N-2, ...
+        return np.where(pos % 2 == 0, pos // 2, num_pairs - 1 - pos // 2)
     elif direction == "outward":
-        # From center to ends
-        mid = num_pairs // 2
-        ordered_indices = [mid]
-        for i in range(1, mid + 1):
-            if mid - i >= 0:
-                ordered_indices.append(mid - i)
-            if mid + i < num_pairs:
-                ordered_indices.append(mid + i)
+        # From center to ends: mid, mid-1, mid+1, mid-2, mid+2, ...
+        step = (pos + 1) // 2
+        return np.where(pos % 2 == 1, num_pairs // 2 - step, num_pairs // 2 + step)
     else:
         raise ValueError("Direction must be 'inward' or 'outward'")
 
-    # Reorder control points
-    ordered_points = []
-    for idx, i in enumerate(ordered_indices):
-        pt1, pt2 = pairs[i]
-        if pt1[0] > pt2[0]:
-            pt1, pt2 = pt2, pt1
-        if mode == "zig_zag" and idx % 2 == 1:
-            ordered_points.extend([pt2, pt1])
-        else:
-            ordered_points.extend([pt1, pt2])
+# Run every pass of an (n, 2, 2) sequence from its smaller-X end; zig-zag flips
+# every second pass (start: sequence position of the first row, for chunks)
+def orient_passes(ordered, mode="one_direction", start=0):
+    flip = ordered[:, 0, 0] > ordered[:, 1, 0]
+    if mode == "zig_zag":
+        flip[(1 - start % 2)::2] ^= True
+    ordered[flip] = ordered[flip][:, ::-1]
+    return ordered
 
-    return ordered_points
+# direction: "inward", "outward" or "travel" (shortest air moves, see pass_sequencer;
+# symmetric=True keeps each pass next to its mirror about the centre line)
+@profiled("reorder")
+def reorder_control_points_dual(pairs, mode="one_direction", direction="inward", symmetric=False):
+    pairs = np.asarray(pairs, dtype=float).reshape(-1, 2, 2)
+
+    if direction == "travel":
+        # Each pass runs from its smaller-X end
+        canon = orient_passes(pairs.copy())
+        order, flip = travel_order(canon, free_entry=(mode == "zig_zag"), symmetric=symmetric)
+        ordered = canon[order]
+        ordered[flip] = ordered[flip][:, ::-1]
+    else:
+        ordered = orient_passes(pairs[pass_order(len(pairs), direction)], mode)
+
+    # Contiguous (2N, 2) array: pt1, pt2 of the first pass, then the next pass, ...
+    return ordered.reshape(-1, 2)
+
+# Jog length and estimated jog time (trapezoidal moves, see cycle_estimator) of every
+# ordering strategy for the same pairs, plus the time "travel" saves over the best
+# fixed sequence
+# (travel_pts: an already computed "travel" ordering, to avoid solving it twice;
+# jog times use the feed and ramps of the machine profile)
+def compare_pass_orders(pairs, mode="one_direction", symmetric=False, travel_pts=None, profile=None):
+    report = {}
+    for direction in ("inward", "outward", "travel"):
+        if direction == "travel" and travel_pts is not None:
+            ordered = travel_pts
+        else:
+            ordered = reorder_control_points_dual(pairs, mode, direction, symmetric)
+        lengths = jog_lengths(ordered)
+        report[direction] = {"jog_mm": float(lengths.sum()), "jog_s": float(move_times(lengths, profile=profile).sum())}
+    report["saved_s"] = min(report["inward"]["jog_s"], report["outward"]["jog_s"]) - report["travel"]["jog_s"]
+    return report
 
 # Write final G-code including plunge, jog, and retract motions
-def write_Gcodes(control_pts, file_path, ini_pt, fin_pt, thinning_t, z_hold):
+# Program body of one patch after the header: approach above the first point at
+# Z 80, plunge / cut / retract / jog moves, then back home. Yields text pieces so
+# it can be streamed to a file or collected by a job_compiler worker.
+# With a tolerance [mm] the moves go through point_reduction first (0 = exact
+# merge of straight runs only); reduction counts are added to stats.
+# progress(fraction) is called after each move block; it may raise to cancel.
+# bottom_tool: optional dual_tool.BottomTool; by default the bottom tool is parked
+# at the patch centre
+# profile: machine profile name / path / MachineProfile (None = default machine)
+def texture_section(control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance=None, stats=None,
+                    progress=None, bottom_tool=None, profile=None):
+    blocks = toolpath_moves(control_pts, thinning_t, z_hold)
+    yield from section_lines(control_pts[0], blocks, 2 * len(control_pts) - 2, ini_pt, fin_pt,
+                             tolerance, stats, progress, bottom_tool, profile)
+
+# texture_section for (n, 3) move blocks that are already expanded, e.g. streamed
+# chunk by chunk (first_pt: first control point, total_moves: for progress)
+def section_lines(first_pt, blocks, total_moves, ini_pt, fin_pt, tolerance=None, stats=None,
+                  progress=None, bottom_tool=None, profile=None):
+    profile = get_profile(profile)
     center_x = (ini_pt[0] + fin_pt[0]) / 2
     center_y = (ini_pt[1] + fin_pt[1]) / 2
+    formatter = profile.parked_formatter(center_x, center_y)
+    if bottom_tool is None:
+        approach_u, approach_v = center_x, center_y
+    else:
+        approach_u, approach_v = bottom_tool.start(first_pt)
 
-    head_lines = [
-        "DELGAT \n",
-        "UNDEFINE ALL \n",
-        "&1 \n",
-        "CLOSE \n",
-        "#1->-16000X \n",
-        "#2->-16000X \n",
-        "#3->16000Y \n",
-        "#4->16000Y \n",
-        "#5->16000Z \n",
-        "#6->-16000U \n",
-        "#7->-16000U \n",
-        "#8->16000V \n",
-        "#9->16000V \n",
-        "#10->-16000W \n",
-        "OPEN PROG 2 \n",
-        "CLEAR \n",
-        "FRAX(X,Y,Z) \n",
-        "ABS \n",
-        "TA 100.0 \n",
-        "TS 50 \n",
-        "X 0.0000 Y 0.0000 Z 80.0000 U 0.0000 V 0.0000 W -80.0000 F 5.0000 \n"
-    ]
+    yield profile.approach_line(first_pt[0], first_pt[1], approach_u, approach_v)
+    # plunge to cutting depth, cut, then retract and jog to next pair
+    if progress is not None:
+        blocks = _report_progress(blocks, max(total_moves, 1), progress)
+    if tolerance is not None:
+        blocks = reduce_move_blocks(blocks, tolerance, stats, formatter)
+    for xyz in blocks:
+        if len(xyz):
+            PROFILER.count("points_written", len(xyz))
+            if bottom_tool is None:
+                yield formatter(xyz)
+            else:
+                yield profile.dual_formatter(np.hstack([xyz, bottom_tool.follow(xyz)]))
+    yield profile.home_return
 
-    with open(file_path, 'w') as file:
-        file.writelines(head_lines)
-        file.write(f"X {control_pts[0][0]:.4f} Y {control_pts[0][1]:.4f} Z 80.0000 U {center_x:.4f} V {center_y:.4f} W -80.0000 \n")
+# The X, Y, Z, U, V, W columns write_Gcodes emits, as a (6, n) array built in memory:
+# home, approach, the moves with the bottom tool parked at the centre (or following
+# bottom_tool), home again. Values are rounded to the profile's precision, so the
+# result equals parsing the file.
+def texture_columns(control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance=None, bottom_tool=None,
+                    profile=None):
+    profile = get_profile(profile)
+    digits = profile.precision
+    center_x = round((ini_pt[0] + fin_pt[0]) / 2, digits)
+    center_y = round((ini_pt[1] + fin_pt[1]) / 2, digits)
+    blocks = toolpath_moves(control_pts, thinning_t, z_hold)
+    if tolerance is not None:
+        blocks = reduce_move_blocks(blocks, tolerance)
+    xyz = np.concatenate([np.empty((0, 3))] + list(blocks))
+
+    n = len(xyz)
+    columns = np.empty((6, n + 3))
+    columns[:, 0] = profile.home
+    columns[:2, 1] = np.round(np.asarray(control_pts[0], dtype=float), digits)
+    columns[2:, 1] = (profile.approach_z, center_x, center_y, profile.approach_w)
+    columns[:3, 2:n + 2] = np.round(xyz, digits).T
+    if bottom_tool is None:
+        columns[3, 2:n + 2] = center_x
+        columns[4, 2:n + 2] = center_y
+        columns[5, 2:n + 2] = profile.park_w
+    else:
+        columns[3:5, 1] = np.round(bottom_tool.start(control_pts[0]), digits)
+        columns[3:, 2:n + 2] = np.round(bottom_tool.follow(xyz), digits).T
+    columns[:, n + 2] = columns[:, 0]
+    return columns
 
-        for i in range(0, len(control_pts), 2):
-            pt1, pt2 = control_pts[i], control_pts[i+1]
-            # plunge to cutting depth
-            file.write(f"X {pt1[0]:.4f} Y {pt1[1]:.4f} Z {-thinning_t:.4f} U {center_x:.4f} V {center_y:.4f} W 0.0000\n")
-            file.write(f"X {pt2[0]:.4f} Y {pt2[1]:.4f} Z {-thinning_t:.4f} U {center_x:.4f} V {center_y:.4f} W 0.0000\n")
-            # retract and jog to next pair
-            if i + 2 < len(control_pts):
-                next_pt = control_pts[i + 2]
-                file.write(f"X {pt2[0]:.4f} Y {pt2[1]:.4f} Z {z_hold:.4f} U {center_x:.4f} V {center_y:.4f} W 0.0000\n")
-                file.write(f"X {next_pt[0]:.4f} Y {next_pt[1]:.4f} Z {z_hold:.4f} U {center_x:.4f} V {center_y:.4f} W 0.0000\n")
+def _report_progress(blocks, total_moves, progress):
+    done = 0
+    for xyz in blocks:
+        done += len(xyz)
+        progress(done / total_moves)
+        yield xyz
 
-        file.write("X 0.0000 Y 0.0000 Z 80.0000 U 0.0000 V 0.0000 W -80.0000 \n")
-        file.write("CLOSE ALL\n")
+# Returns the point reduction stats when a tolerance is given, else None.
+# With a bottom_tool its clearance report is in bottom_tool.clearance afterwards.
+# The file only appears once it is complete (see GcodeWriter).
+@profiled("write")
+def write_Gcodes(control_pts, file_path, ini_pt, fin_pt, thinning_t, z_hold, tolerance=None, progress=None,
+                 bottom_tool=None, profile=None):
+    profile = get_profile(profile)
+    stats = new_reduction_stats() if tolerance is not None else None
+    with GcodeWriter(file_path) as writer:
+        writer.write_lines([profile.program_start])
+        writer.write_lines(texture_section(control_pts, ini_pt, fin_pt, thinning_t, z_hold, tolerance, stats,
+                                           progress, bottom_tool, profile))
+        writer.write_lines([profile.footer])
+    if PROFILER.enabled:
+        PROFILER.count("bytes_written", os.path.getsize(file_path))
+    return stats
 
 if __name__ == "__main__":
     t = Initializer()
@@ -204,7 +351,7 @@ if __name__ == "__main__":
     # Generate, reorder, and write toolpath
     control_pairs = generate_control_pairs(t.ini_pt, t.fin_pt, t.angle, t.sp)
     ordered_points = reorder_control_points_dual(control_pairs, mode=t.mode, direction=t.flag)
-    write_Gcodes(ordered_points, file_path, t.ini_pt, t.fin_pt, t.thinning_t, t.z_hold)
+    write_Gcodes(ordered_points, file_path, t.ini_pt, t.fin_pt, t.thinning_t, t.z_hold, profile=t.profile)
 
     print(f"Dual path G-code saved to: {file_path}")
     
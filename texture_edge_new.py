@@ -2,29 +2,15 @@ import os
 from datetime import datetime
 import numpy as np
 import matplotlib.pyplot as plt
+from machine_profile import get_profile
+from texture_dual import texture_bounds
 
-def generate_edge_gcode(loc):
-    texture_w = 50
-    length = 250
-    offset = 5  # outward expansion from the square edge
-    x_coord = length / 4 - texture_w / 2
-    y_coord = length / 4 - texture_w / 2
-
-    if loc == "1":
-        ini_pt = [x_coord, y_coord]
-        fin_pt = [x_coord + texture_w, y_coord + texture_w]
-    elif loc == "2":
-        ini_pt = [-x_coord - texture_w, y_coord]
-        fin_pt = [-x_coord, y_coord + texture_w]
-    elif loc == "3":
-        ini_pt = [-(x_coord + texture_w), -(y_coord + texture_w)]
-        fin_pt = [-x_coord, -y_coord]
-    elif loc == "4":
-        ini_pt = [x_coord, -(y_coord + texture_w)]
-        fin_pt = [x_coord + texture_w, -y_coord]
-    else:
-        raise ValueError("Invalid location number (should be 1–4)")
+EDGE_OFFSET = 5      # outward expansion from the square edge
+EDGE_Z = -0.15
 
+# Closed outline of the patch at loc expanded by offset, and its centre
+def edge_outline(loc, offset=EDGE_OFFSET):
+    ini_pt, fin_pt = texture_bounds(loc)
     x_min, y_min = min(ini_pt[0], fin_pt[0]), min(ini_pt[1], fin_pt[1])
     x_max, y_max = max(ini_pt[0], fin_pt[0]), max(ini_pt[1], fin_pt[1])
 
@@ -44,32 +30,33 @@ def generate_edge_gcode(loc):
 
     center_x = (x_min + x_max) / 2
     center_y = (y_min + y_max) / 2
-    z_height = -0.15
-
-    head_lines = [
-        "DELGAT \n",
-        "UNDEFINE ALL \n",
-        "&1 \n",
-        "CLOSE \n",
-        "#1->-16000X \n",
-        "#2->-16000X \n",
-        "#3->16000Y \n",
-        "#4->16000Y \n",
-        "#5->16000Z \n",
-        "#6->-16000U \n",
-        "#7->-16000U \n",
-        "#8->16000V \n",
-        "#9->16000V \n",
-        "#10->-16000W \n",
-        "OPEN PROG 2 \n",
-        "CLEAR \n",
-        "FRAX(X,Y,Z) \n",
-        "ABS \n",
-        "TA 100.0 \n",
-        "TS 50 \n",
-        "X 0.0000 Y 0.0000 Z 80.0000 U 0.0000 V 0.0000 W -80.0000 F 5.0000 \n",
-        f"X {corners[0][0]:.4f} Y {corners[0][1]:.4f} Z 80.0000 U {center_x:.4f} V {center_y:.4f} W -80.0000 F 5.0000\n"
-    ]
+    return ini_pt, fin_pt, corners, center_x, center_y
+
+# Outline moves of one edge pass, bottom tool parked at the centre
+def edge_moves(corners, center_x, center_y, z_height=EDGE_Z, profile=None):
+    profile = get_profile(profile)
+    return [profile.dual_template % (x, y, z_height, center_x, center_y, profile.park_w)
+            for x, y in corners]
+
+# Approach above the first corner, with the feed
+def edge_approach(corners, center_x, center_y, profile):
+    return profile.edge_approach_template % (corners[0][0], corners[0][1], center_x, center_y)
+
+# One location's edge pass inside a combined program: home, approach above the
+# first corner at Z 80, the outline, then back home
+def edge_section(loc, profile=None):
+    profile = get_profile(profile)
+    _, _, corners, center_x, center_y = edge_outline(loc)
+    return ([profile.edge_home_line, edge_approach(corners, center_x, center_y, profile)]
+            + edge_moves(corners, center_x, center_y, profile=profile)
+            + [profile.edge_home_return])
+
+def generate_edge_gcode(loc, profile=None):
+    profile = get_profile(profile)
+    offset = EDGE_OFFSET
+    ini_pt, fin_pt, corners, center_x, center_y = edge_outline(loc, offset)
+
+    head_lines = [profile.program_start, edge_approach(corners, center_x, center_y, profile)]
 
     date_code = datetime.now().strftime("%m%d")
     folder_name = f"edge_path_{date_code}"
@@ -79,10 +66,8 @@ def generate_edge_gcode(loc):
 
     with open(file_path, 'w') as file:
         file.writelines(head_lines)
-        for x, y in corners:
-            variables = [x, y, z_height, center_x, center_y, 0.0]
-            file.write("X %.4f Y %.4f Z %.4f U %.4f V %.4f W %.4f\n" % tuple(variables))
-        file.write("CLOSE ALL\n")
+        file.writelines(edge_moves(corners, center_x, center_y, profile=profile))
+        file.write(profile.footer)
 
     print(f"Edge G-code saved to: {file_path}")
     return ini_pt, fin_pt, offset
@@ -117,7 +102,8 @@ def plot_squares(ini_pt, fin_pt, offset):
     plt.grid(True)
     plt.show()
 
-def main():
+def main(profile=None):
+    profile = get_profile(profile)
     date_code = datetime.now().strftime("%m%d")
     folder_name = f"edge_path_{date_code}"
     os.makedirs(folder_name, exist_ok=True)
@@ -125,78 +111,11 @@ def main():
 
     with open(file_path, 'w') as file:
         for loc in ["1", "2", "3", "4"]:
-            texture_w = 50
-            length = 250
-            offset = 5
-            x_coord = length / 4 - texture_w / 2
-            y_coord = length / 4 - texture_w / 2
-
-            if loc == "1":
-                ini_pt = [x_coord, y_coord]
-                fin_pt = [x_coord + texture_w, y_coord + texture_w]
-            elif loc == "2":
-                ini_pt = [-x_coord - texture_w, y_coord]
-                fin_pt = [-x_coord, y_coord + texture_w]
-            elif loc == "3":
-                ini_pt = [-(x_coord + texture_w), -(y_coord + texture_w)]
-                fin_pt = [-x_coord, -y_coord]
-            elif loc == "4":
-                ini_pt = [x_coord, -(y_coord + texture_w)]
-                fin_pt = [x_coord + texture_w, -y_coord]
-
-            x_min, y_min = min(ini_pt[0], fin_pt[0]), min(ini_pt[1], fin_pt[1])
-            x_max, y_max = max(ini_pt[0], fin_pt[0]), max(ini_pt[1], fin_pt[1])
-            x_min -= offset
-            y_min -= offset
-            x_max += offset
-            y_max += offset
-
-            corners = [
-                (x_min, y_min),
-                (x_max, y_min),
-                (x_max, y_max),
-                (x_min, y_max),
-                (x_min, y_min)
-            ]
-
-            center_x = (x_min + x_max) / 2
-            center_y = (y_min + y_max) / 2
-            z_height = -0.15
-
             if loc == "1":  # only include head_lines once at the beginning
-                head_lines = [
-                    "DELGAT \n",
-                    "UNDEFINE ALL \n",
-                    "&1 \n",
-                    "CLOSE \n",
-                    "#1->-16000X \n",
-                    "#2->-16000X \n",
-                    "#3->16000Y \n",
-                    "#4->16000Y \n",
-                    "#5->16000Z \n",
-                    "#6->-16000U \n",
-                    "#7->-16000U \n",
-                    "#8->16000V \n",
-                    "#9->16000V \n",
-                    "#10->-16000W \n",
-                    "OPEN PROG 2 \n",
-                    "CLEAR \n",
-                    "FRAX(X,Y,Z) \n",
-                    "ABS \n",
-                    "TA 100.0 \n",
-                    "TS 50 \n",
-                ]
-                file.writelines(head_lines)
-
-            file.write("X 0.0000 Y 0.0000 Z 80.0000 U 0.0000 V 0.0000 W -80.0000 F 5.0000\n")
-            file.write(f"X {corners[0][0]:.4f} Y {corners[0][1]:.4f} Z 80.0000 U {center_x:.4f} V {center_y:.4f} W -80.0000 F 5.0000\n")
-
-            for x, y in corners:
-                variables = [x, y, z_height, center_x, center_y, 0.0]
-                file.write("X %.4f Y %.4f Z %.4f U %.4f V %.4f W %.4f\n" % tuple(variables))
-            file.write("X 0.0000 Y 0.0000 Z 80.0000 U 0.0000 V 0.0000 W -80.0000\n")
-
-        file.write("CLOSE ALL\n")
+                file.write(profile.header)
+            file.writelines(edge_section(loc, profile))
+
+        file.write(profile.footer)
     print(f"Combined edge G-code saved to: {file_path}")
 
 if __name__ == "__main__":
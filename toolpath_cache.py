@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Binary sidecar cache for parsed G-code programs.
+
+The first time a program is loaded (or exported), its (6, n) X/Y/Z/U/V/W array is
+written next to it as "<program>.toolpath.npy" while the text is streamed through
+the parser. Later loads memory-map that file instead of reparsing the text. Entries are keyed on file size + mtime (cheap check) and on a
+content hash (checked when the mtime changed), and the sidecars are evicted least
+recently used first once their total size passes the budget.
+
+@author: kangputong
+"""
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from numpy.lib import format as npy_format
+from gcode_parser import parse_gcode, iter_gcode_blocks
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".ampl_toolpath_cache.json")
+DEFAULT_MAX_BYTES = 2 << 30     # 2 GB of sidecars
+SIDECAR_SUFFIX = ".toolpath.npy"
+HASH_CHUNK_SIZE = 16 << 20
+
+# Content hash of a G-code file, read in chunks
+def file_hash(file_path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for data in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+# Writes a sidecar block by block while a program is parsed. The array is stored in
+# Fortran order, so the moves can be appended without knowing n in advance; np.load
+# maps it as the same (6, n) array. The sidecar only replaces an old one, and joins
+# the cache, when the block exits cleanly; in a read-only folder nothing is written.
+class SidecarWriter:
+    def __init__(self, cache, file_path):
+        self.cache = cache
+        self.file_path = os.path.abspath(file_path)
+        self.sidecar = cache.sidecar_path(self.file_path)
+        self.tmp_path = self.sidecar + ".tmp"
+        self.stat = os.stat(self.file_path)
+        self.moves = 0
+        self.file = None
+        self.written = False
+
+    def _write_header(self):
+        self.file.seek(0)
+        npy_format.write_array_header_1_0(self.file, {
+            "descr": npy_format.dtype_to_descr(np.dtype(float)),
+            "fortran_order": True,
+            "shape": (6, self.moves),
+        })
+
+    def __enter__(self):
+        try:
+            self.file = open(self.tmp_path, 'wb')
+            self._write_header()
+            self.data_start = self.file.tell()
+        except OSError:
+            self._discard()     # read-only folder: just skip caching
+        return self
+
+    # One (6, m) block of parsed moves
+    def add(self, block):
+        if self.file is None:
+            return
+        try:
+            self.file.write(np.ascontiguousarray(np.asarray(block, dtype=float).T).tobytes())
+            self.moves += block.shape[1]
+        except OSError:
+            self._discard()     # e.g. disk full: the parse goes on without a sidecar
+
+    # The final header has the same size as the first (numpy pads it for growth)
+    def _finish(self):
+        self._write_header()
+        same_size = self.file.tell() == self.data_start
+        self.file.close()
+        return same_size
+
+    def _discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.file is None:
+            return
+        try:
+            if exc_type is None and self._finish():
+                os.replace(self.tmp_path, self.sidecar)
+                self.file = None
+                self.cache.add_entry(self.file_path, self.stat)
+                self.written = True
+                return
+        except OSError:
+            pass
+        self._discard()
+
+class ToolpathCache:
+    def __init__(self, index_path=DEFAULT_INDEX_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.entries = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(self.entries, file)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def sidecar_path(file_path):
+        return file_path + SIDECAR_SUFFIX
+
+    # The memory-mapped (6, n) array of a file with a fresh sidecar, else None.
+    # Never parses, so streaming readers can fall back to the text themselves.
+    def load_cached(self, file_path):
+        file_path = os.path.abspath(file_path)
+        sidecar = self.sidecar_path(file_path)
+        st = os.stat(file_path)
+        entry = self.entries.get(file_path)
+        if entry is None or not os.path.exists(sidecar):
+            return None
+        fresh = entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size
+        if not fresh and entry["size"] == st.st_size and entry["hash"] == file_hash(file_path):
+            entry["mtime"] = st.st_mtime_ns
+            fresh = True
+        if not fresh:
+            return None
+        self.hits += 1
+        entry["last_used"] = time.time()
+        self._write_index()
+        return np.load(sidecar, mmap_mode='r')
+
+    # Streams the parse of a missed file into its sidecar: call add() with every
+    # parsed block inside the with-block (see SidecarWriter)
+    def sidecar_writer(self, file_path):
+        self.misses += 1
+        return SidecarWriter(self, file_path)
+
+    # Record a freshly written sidecar (st: the program's stat when it was parsed)
+    def add_entry(self, file_path, st):
+        self.entries[file_path] = {
+            "hash": file_hash(file_path),
+            "mtime": st.st_mtime_ns,
+            "size": st.st_size,
+            "nbytes": os.path.getsize(self.sidecar_path(file_path)),
+            "last_used": time.time(),
+        }
+        self.evict(keep=file_path)
+        self._write_index()
+
+    # Return the (6, n) array for a G-code file, memory-mapped read-only when cached
+    def load(self, file_path):
+        data = self.load_cached(file_path)
+        if data is not None:
+            return data
+        with self.sidecar_writer(file_path) as sidecar:
+            for block in iter_gcode_blocks(file_path):
+                sidecar.add(block)
+        if not sidecar.written:
+            return parse_gcode(file_path)     # read-only folder: just skip caching
+        return np.load(sidecar.sidecar, mmap_mode='r')
+
+    # Drop least recently used sidecars until the total fits the budget
+    def evict(self, keep=None):
+        for path in [p for p in self.entries if not os.path.exists(self.sidecar_path(p))]:
+            del self.entries[path]
+        total = sum(entry["nbytes"] for entry in self.entries.values())
+        for path in sorted(self.entries, key=lambda p: self.entries[p]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(self.sidecar_path(path))
+            except OSError:
+                pass
+            total -= self.entries.pop(path)["nbytes"]
+
+    # Remove every sidecar known to this cache
+    def clear(self):
+        for path in list(self.entries):
+            try:
+                os.remove(self.sidecar_path(path))
+            except OSError:
+                pass
+        self.entries = {}
+        self._write_index()
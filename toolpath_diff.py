@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Toolpath diff: prove two G-code programs move the same, or show where they do not.
+
+Both programs are streamed through the chunked parser, so memory stays at a few
+windows of moves however large the files are. The byte-identical start of the two
+files is found first and skipped without parsing (its moves are only counted).
+From there moves are compared numerically, axis by axis, within a tolerance:
+  - windows whose moves are bit-identical are skipped after a digest check
+  - the first divergence is reported with both moves and their move indices
+  - the largest deviation per axis is kept over all aligned moves
+  - when moves stop matching, a bounded look-ahead searches for the nearest point
+    where both programs run together again, using hashes of RESYNC_RUN-move windows
+    (moves quantized to the profile's written precision); a shifted match is reported as
+    inserted or deleted moves, otherwise the moves count as changed
+Only motion lines are compared (as parsed by gcode_parser); the header is not.
+
+A program can also be reduced to a signature, a chain of chunk digests, which is
+all that needs to be kept to verify later output against it.
+
+Usage:
+    python toolpath_diff.py old.txt new.txt [--tol 1e-4] [--profile NAME]
+    python toolpath_diff.py old.txt --save-signature old.sig.json
+    python toolpath_diff.py new.txt --signature old.sig.json
+
+Exit status 1 when the programs (or program and signature) differ.
+
+@author: kangputong
+"""
+
+import argparse
+import hashlib
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from gcode_parser import AXES, DEFAULT_CHUNK_SIZE, iter_gcode_blocks, count_block_moves
+from machine_profile import get_profile
+
+DEFAULT_TOLERANCE = 1e-4
+WINDOW_MOVES = 1 << 16      # moves compared per step
+RESYNC_MOVES = 4096         # how far ahead a resync looks in each program
+RESYNC_RUN = 8              # consecutive matching moves needed to resync
+MAX_REPORTED_EDITS = 20
+SIGNATURE_CHUNK_MOVES = 1 << 16
+TOLERANCE_SLACK = 1e-9      # decimal values are not exact in binary
+PREFIX_BLOCK = 16 << 20     # bytes per read when looking for the common start
+
+_MOVE_MIX = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+                      0xD6E8FEB86659FD93, 0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53], dtype=np.uint64)
+_WINDOW_MIX = np.array([0x100000001B3 ** (RESYNC_RUN - 1 - k) % (1 << 64) for k in range(RESYNC_RUN)],
+                       dtype=np.uint64)
+
+# Buffered reader of (n, 6) moves with look-ahead
+class MoveStream:
+    # offset: byte offset (at a line start) to begin at, position: its move index
+    def __init__(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE, offset=0, position=0):
+        self.blocks = iter_gcode_blocks(file_path, chunk_size, offset=offset)
+        self.buffer = np.empty((0, 6))
+        self.position = position    # move index of buffer[0]
+
+    def peek(self, n):
+        pending = [self.buffer]
+        available = len(self.buffer)
+        while available < n:
+            block = next(self.blocks, None)
+            if block is None:
+                break
+            pending.append(block.T)
+            available += block.shape[1]
+        if len(pending) > 1:
+            self.buffer = np.concatenate(pending)
+        return self.buffer[:n]
+
+    def advance(self, n):
+        self.buffer = self.buffer[n:]
+        self.position += n
+
+    # Skip to the end; returns the number of moves skipped
+    def drain(self):
+        count = len(self.buffer)
+        for block in self.blocks:
+            count += block.shape[1]
+        self.buffer = np.empty((0, 6))
+        self.position += count
+        return count
+
+# Length in bytes of the identical start of two files, cut back to a line start,
+# and the number of moves the parser reads from it. Only whole lines are taken
+# from each identical block; the partial last line is carried into the next read,
+# so the prefix never ends inside a line that crosses a block boundary.
+def common_prefix(path_a, path_b, block_size=PREFIX_BLOCK):
+    offset, moves, carry = 0, 0, b""
+    with open(path_a, 'rb') as file_a, open(path_b, 'rb') as file_b:
+        while True:
+            data_a, data_b = file_a.read(block_size), file_b.read(block_size)
+            same = data_a == data_b
+            if not same:
+                n = min(len(data_a), len(data_b))
+                differ = np.flatnonzero(np.frombuffer(data_a, np.uint8, n) != np.frombuffer(data_b, np.uint8, n))
+                data_a = data_a[:int(differ[0]) if len(differ) else n]
+            text = carry + data_a
+            # Both files ended together: the last line is complete too
+            cut = len(text) if same and not data_a else text.rfind(b"\n") + 1
+            if cut:
+                moves += count_block_moves(text[:cut])
+                offset += cut
+            carry = text[cut:]
+            if not same or not data_a:
+                return offset, moves
+
+# Moves as integer steps of resolution (the profile's written precision, e.g. 1e-4)
+def quantize(moves, resolution):
+    return np.round(np.asarray(moves) / resolution).astype(np.int64)
+
+# One uint64 per move, equal for moves that are equal at the written precision
+def move_hashes(moves, resolution):
+    with np.errstate(over="ignore"):
+        return (quantize(moves, resolution).view(np.uint64) * _MOVE_MIX).sum(axis=1, dtype=np.uint64)
+
+# Hash of every RESYNC_RUN-move window starting at each move
+def window_hashes(moves, resolution):
+    h = move_hashes(moves, resolution)
+    if len(h) < RESYNC_RUN:
+        return np.empty(0, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        return (sliding_window_view(h, RESYNC_RUN) * _WINDOW_MIX).sum(axis=1, dtype=np.uint64)
+
+def _digest(moves):
+    return hashlib.blake2b(np.ascontiguousarray(moves).tobytes(), digest_size=16).digest()
+
+def new_diff_report(tolerance):
+    return {"tolerance": tolerance, "moves_a": 0, "moves_b": 0, "skipped": 0, "compared": 0,
+            "changed": 0, "inserted": 0, "deleted": 0, "max_deviation": dict.fromkeys(AXES, 0.0),
+            "first_divergence": None, "edits": []}
+
+def _note_edit(report, kind, index_a, index_b, count, move_a=None, move_b=None):
+    if report["first_divergence"] is None:
+        report["first_divergence"] = {"kind": kind, "index_a": index_a, "index_b": index_b,
+                                      "move_a": None if move_a is None else move_a.tolist(),
+                                      "move_b": None if move_b is None else move_b.tolist()}
+    if len(report["edits"]) < MAX_REPORTED_EDITS:
+        report["edits"].append({"kind": kind, "index_a": index_a, "index_b": index_b, "count": count})
+
+# Deviations and changed moves of two aligned runs of moves
+def _compare_aligned(report, a, b, index_a, index_b):
+    if len(a) == 0:
+        return
+    deviation = np.abs(a - b)
+    peak = deviation.max(axis=0)
+    for axis, value in zip(AXES, peak.tolist()):
+        report["max_deviation"][axis] = max(report["max_deviation"][axis], value)
+    report["compared"] += len(a)
+    bad = np.flatnonzero((deviation > report["tolerance"] + TOLERANCE_SLACK).any(axis=1))
+    if len(bad):
+        report["changed"] += len(bad)
+        # Runs of consecutive changed moves become one edit each
+        starts = bad[np.r_[True, np.diff(bad) > 1]]
+        ends = bad[np.r_[np.diff(bad) > 1, True]] + 1
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            _note_edit(report, "changed", index_a + start, index_b + start, end - start, a[start], b[start])
+
+# Nearest (skip_a, skip_b) after which RESYNC_RUN moves match again, or None
+def _resync(stream_a, stream_b, tolerance, resolution):
+    a = stream_a.peek(RESYNC_MOVES + RESYNC_RUN)
+    b = stream_b.peek(RESYNC_MOVES + RESYNC_RUN)
+    ha, hb = window_hashes(a, resolution), window_hashes(b, resolution)
+    first_b = {}
+    for index, h in enumerate(hb.tolist()):
+        first_b.setdefault(h, index)
+    best = None
+    for skip_a, h in enumerate(ha.tolist()):
+        if best is not None and skip_a >= sum(best):
+            break
+        skip_b = first_b.get(h)
+        if skip_b is None or (best is not None and skip_a + skip_b >= sum(best)):
+            continue
+        run_a, run_b = a[skip_a:skip_a + RESYNC_RUN], b[skip_b:skip_b + RESYNC_RUN]
+        if np.abs(run_a - run_b).max() <= tolerance + TOLERANCE_SLACK:
+            best = (skip_a, skip_b)
+    return best
+
+# Stream both programs and compare their moves; returns a report dict.
+# profile: the machine profile the programs were written for (its precision)
+def diff_programs(path_a, path_b, tolerance=DEFAULT_TOLERANCE, window=WINDOW_MOVES, prefix_block=PREFIX_BLOCK,
+                  profile=None):
+    resolution = get_profile(profile).resolution
+    report = new_diff_report(tolerance)
+    offset, moves = common_prefix(path_a, path_b, prefix_block)
+    report["skipped"] = report["compared"] = moves
+    stream_a = MoveStream(path_a, offset=offset, position=moves)
+    stream_b = MoveStream(path_b, offset=offset, position=moves)
+    while True:
+        a, b = stream_a.peek(window), stream_b.peek(window)
+        m = min(len(a), len(b))
+        if m == 0:
+            break
+        a, b = a[:m], b[:m]
+        index_a, index_b = stream_a.position, stream_b.position
+        if _digest(a) == _digest(b):
+            report["skipped"] += m
+            report["compared"] += m
+            stream_a.advance(m)
+            stream_b.advance(m)
+            continue
+
+        bad = (np.abs(a - b) > tolerance + TOLERANCE_SLACK).any(axis=1)
+        if not bad.any():
+            _compare_aligned(report, a, b, index_a, index_b)
+            stream_a.advance(m)
+            stream_b.advance(m)
+            continue
+
+        # Matching moves up to the first divergence, then look for a shifted match
+        k = int(np.argmax(bad))
+        _compare_aligned(report, a[:k], b[:k], index_a, index_b)
+        stream_a.advance(k)
+        stream_b.advance(k)
+        index_a, index_b = stream_a.position, stream_b.position
+        found = _resync(stream_a, stream_b, tolerance, resolution)
+        if found is not None and found[0] != found[1]:
+            skip_a, skip_b = found
+            common = min(skip_a, skip_b)
+            a, b = stream_a.peek(skip_a), stream_b.peek(skip_b)
+            _compare_aligned(report, a[:common], b[:common], index_a, index_b)
+            if skip_a > common:
+                report["deleted"] += skip_a - common
+                _note_edit(report, "deleted", index_a + common, index_b + common, skip_a - common,
+                           move_a=a[common])
+            else:
+                report["inserted"] += skip_b - common
+                _note_edit(report, "inserted", index_a + common, index_b + common, skip_b - common,
+                           move_b=b[common])
+            stream_a.advance(skip_a)
+            stream_b.advance(skip_b)
+        else:
+            # No shift explains it: the moves were changed in place
+            a, b = stream_a.peek(window), stream_b.peek(window)
+            m = min(len(a), len(b))
+            _compare_aligned(report, a[:m], b[:m], index_a, index_b)
+            stream_a.advance(m)
+            stream_b.advance(m)
+
+    # Whatever is left in one program only was deleted / inserted at its end
+    index_a, index_b = stream_a.position, stream_b.position
+    left_a, left_b = stream_a.peek(1), stream_b.peek(1)
+    rest_a, rest_b = stream_a.drain(), stream_b.drain()
+    if rest_a:
+        report["deleted"] += rest_a
+        _note_edit(report, "deleted", index_a, index_b, rest_a, move_a=left_a[0])
+    if rest_b:
+        report["inserted"] += rest_b
+        _note_edit(report, "inserted", index_a, index_b, rest_b, move_b=left_b[0])
+    report["moves_a"], report["moves_b"] = stream_a.position, stream_b.position
+    report["identical"] = report["first_divergence"] is None
+    return report
+
+def format_diff(report):
+    lines = [f"Moves: {report['moves_a']:,} vs {report['moves_b']:,} "
+             f"({report['skipped']:,} skipped as identical, tolerance {report['tolerance']:g})"]
+    deviation = report["max_deviation"]
+    lines.append("Max deviation: " + ", ".join(f"{axis} {deviation[axis]:.4f}" for axis in AXES))
+    if report["identical"]:
+        lines.append("Programs match within tolerance")
+        return "\n".join(lines)
+    first = report["first_divergence"]
+    lines.append(f"First divergence: {first['kind']} at move {first['index_a']:,} (a) / {first['index_b']:,} (b)")
+    for side in ("a", "b"):
+        move = first[f"move_{side}"]
+        if move is not None:
+            lines.append(f"  {side}: " + " ".join(f"{axis} {value:.4f}" for axis, value in zip(AXES, move)))
+    lines.append(f"Changed {report['changed']:,}, inserted {report['inserted']:,}, deleted {report['deleted']:,} moves")
+    for edit in report["edits"]:
+        lines.append(f"  {edit['kind']:>8} {edit['count']:>8,} at a:{edit['index_a']:,} b:{edit['index_b']:,}")
+    if len(report["edits"]) == MAX_REPORTED_EDITS:
+        lines.append(f"  (only the first {MAX_REPORTED_EDITS} edits are listed)")
+    return "\n".join(lines)
+
+# Chain of chunk digests over the moves quantized to the profile's precision, each
+# digest covering all before it
+def program_signature(file_path, chunk_moves=SIGNATURE_CHUNK_MOVES, profile=None, resolution=None):
+    if resolution is None:
+        resolution = get_profile(profile).resolution
+    stream = MoveStream(file_path)
+    chain, digests = b"", []
+    while True:
+        moves = stream.peek(chunk_moves)
+        if len(moves) == 0:
+            break
+        chain = hashlib.blake2b(chain + quantize(moves, resolution).tobytes(), digest_size=16).digest()
+        digests.append(chain.hex())
+        stream.advance(len(moves))
+    return {"chunk_moves": chunk_moves, "resolution": resolution, "moves": stream.position, "chunks": digests}
+
+# First chunk (as a move range) where a program departs from a signature, or None.
+# The program is quantized like the signature (signatures without a resolution
+# were taken at the default profile's precision).
+def verify_signature(file_path, signature):
+    resolution = signature.get("resolution") or get_profile().resolution
+    current = program_signature(file_path, signature["chunk_moves"], resolution=resolution)
+    size = signature["chunk_moves"]
+    for index, (old, new) in enumerate(zip(signature["chunks"], current["chunks"])):
+        if old != new:
+            return index * size, min((index + 1) * size, max(signature["moves"], current["moves"]))
+    if signature["moves"] != current["moves"]:
+        start = min(signature["moves"], current["moves"])
+        return start, max(signature["moves"], current["moves"])
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the moves of two G-code programs.")
+    parser.add_argument("program", help="G-code program (.txt)")
+    parser.add_argument("other", nargs="?", help="program to compare against")
+    parser.add_argument("--tol", type=float, default=DEFAULT_TOLERANCE, help="allowed deviation per axis [mm]")
+    parser.add_argument("--profile", default=None, help="machine profile the programs were written for")
+    parser.add_argument("--save-signature", metavar="FILE", help="write the program's chunk signature")
+    parser.add_argument("--signature", metavar="FILE", help="verify the program against a saved signature")
+    args = parser.parse_args(argv)
+
+    if args.save_signature:
+        signature = program_signature(args.program, profile=args.profile)
+        with open(args.save_signature, 'w') as file:
+            json.dump(signature, file)
+        print(f"{signature['moves']:,} moves, {len(signature['chunks'])} chunks -> {args.save_signature}")
+        return 0
+    if args.signature:
+        with open(args.signature, 'r') as file:
+            mismatch = verify_signature(args.program, json.load(file))
+        if mismatch is None:
+            print("Program matches the signature")
+            return 0
+        print(f"Program departs from the signature in moves {mismatch[0]:,} .. {mismatch[1]:,}")
+        return 1
+    if args.other is None:
+        parser.error("give a second program, --signature or --save-signature")
+    report = diff_programs(args.program, args.other, args.tol, profile=args.profile)
+    print(format_diff(report))
+    return 0 if report["identical"] else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of toolpath columns (X, Y, Z, U, V, W) to CSV, Parquet, Feather
+or Excel.
+
+The source is either a G-code file, which is parsed chunk by chunk and never held
+whole, or an already parsed (6, n) array (e.g. a cached .toolpath.npy memmap).
+Rows are written in groups of chunk_rows:
+  csv      plain text, one %-substitution per chunk like the G-code writer
+  parquet  one row group per chunk            (needs pyarrow)
+  feather  Arrow IPC file, one record batch per chunk   (needs pyarrow)
+  xlsx     through pandas; a program longer than one sheet continues on the
+           next sheet (toolpath_1, toolpath_2, ...). Excel is by far the slowest format.
+
+Every export goes through a temporary file that replaces the target only when it
+is complete. progress(fraction) is called after every chunk and may raise to
+cancel the export. on_block sees every parsed block, e.g. to fill a toolpath_cache
+sidecar during the same pass.
+
+Usage:
+    python toolpath_export.py program.txt -f parquet [-o program.parquet] [--chunk-rows N]
+
+@author: kangputong
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from gcode_parser import AXES, DEFAULT_CHUNK_SIZE, iter_text_chunks, parse_block
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+except ImportError:     # Parquet / Feather are optional
+    pa = None
+
+FORMATS = ("csv", "parquet", "feather", "xlsx")
+EXTENSIONS = {".csv": "csv", ".parquet": "parquet", ".feather": "feather", ".arrow": "feather",
+              ".xlsx": "xlsx"}
+DEFAULT_CHUNK_ROWS = 1 << 20
+EXCEL_MAX_ROWS = 1_048_576 - 1     # sheet limit minus the header row
+EXCEL_SHEET_PREFIX = "toolpath"
+
+def format_for(out_path):
+    ext = os.path.splitext(out_path)[1].lower()
+    if ext not in EXTENSIONS:
+        raise ValueError(f"Unsupported export format: {ext} (use {', '.join(EXTENSIONS)})")
+    return EXTENSIONS[ext]
+
+def export_path(gcode_path, fmt, folder=None):
+    base = os.path.splitext(os.path.basename(gcode_path))[0] + "." + fmt
+    return os.path.join(folder or os.path.dirname(gcode_path), base)
+
+# (6, m) blocks of at most chunk_rows rows with the fraction of the source done.
+# on_block(block) is also called with every block parsed from a file source.
+def iter_chunks(source, chunk_rows=DEFAULT_CHUNK_ROWS, on_block=None):
+    if isinstance(source, (str, os.PathLike)):
+        size = max(os.path.getsize(source), 1)
+        done = 0
+        pending, pending_rows = [], 0
+        for text in iter_text_chunks(source, DEFAULT_CHUNK_SIZE):
+            done += len(text)
+            block = parse_block(text)
+            if on_block is not None:
+                on_block(block)
+            pending.append(block)
+            pending_rows += block.shape[1]
+            while pending_rows >= chunk_rows:
+                data = np.concatenate(pending, axis=1)
+                yield data[:, :chunk_rows], done / size
+                pending, pending_rows = [data[:, chunk_rows:]], data.shape[1] - chunk_rows
+        if pending_rows:
+            yield np.concatenate(pending, axis=1), 1.0
+    else:
+        data = np.asarray(source).reshape(6, -1)
+        n = data.shape[1]
+        for start in range(0, n, chunk_rows):
+            stop = min(start + chunk_rows, n)
+            yield np.asarray(data[:, start:stop], dtype=float), stop / n
+
+def _write_csv(chunks, path, progress):
+    rows = 0
+    line_template = ",".join(["%.4f"] * len(AXES)) + "\n"
+    with open(path, 'w', buffering=1 << 20) as file:
+        file.write(",".join(AXES) + "\n")
+        for block, fraction in chunks:
+            m = block.shape[1]
+            file.write((line_template * m) % tuple(block.T.ravel().tolist()))
+            rows += m
+            if progress is not None:
+                progress(fraction)
+    return rows
+
+def _require_pyarrow(fmt):
+    if pa is None:
+        raise RuntimeError(f"{fmt} export needs pyarrow (pip install pyarrow)")
+
+def _arrow_batch(block):
+    return pa.record_batch([pa.array(column) for column in block], names=list(AXES))
+
+def _write_parquet(chunks, path, progress):
+    _require_pyarrow("Parquet")
+    schema = pa.schema([(axis, pa.float64()) for axis in AXES])
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for block, fraction in chunks:
+            writer.write_table(pa.Table.from_batches([_arrow_batch(block)], schema=schema))
+            rows += block.shape[1]
+            if progress is not None:
+                progress(fraction)
+    return rows
+
+def _write_feather(chunks, path, progress):
+    _require_pyarrow("Feather")
+    schema = pa.schema([(axis, pa.float64()) for axis in AXES])
+    rows = 0
+    with pa.OSFile(path, 'wb') as sink, ipc.new_file(sink, schema) as writer:
+        for block, fraction in chunks:
+            writer.write_batch(_arrow_batch(block))
+            rows += block.shape[1]
+            if progress is not None:
+                progress(fraction)
+    return rows
+
+def _write_xlsx(chunks, path, progress):
+    rows = 0
+    sheet, sheet_rows = 1, 0
+    with pd.ExcelWriter(path) as writer:
+        for block, fraction in chunks:
+            start = 0
+            while start < block.shape[1]:
+                if sheet_rows == EXCEL_MAX_ROWS:
+                    sheet, sheet_rows = sheet + 1, 0
+                take = min(EXCEL_MAX_ROWS - sheet_rows, block.shape[1] - start)
+                frame = pd.DataFrame(block[:, start:start + take].T, columns=list(AXES))
+                frame.to_excel(writer, sheet_name=f"{EXCEL_SHEET_PREFIX}_{sheet}", index=False,
+                               header=sheet_rows == 0, startrow=sheet_rows + (sheet_rows > 0))
+                sheet_rows += take
+                start += take
+            rows += block.shape[1]
+            if progress is not None:
+                progress(fraction)
+    return rows
+
+WRITERS = {"csv": _write_csv, "parquet": _write_parquet, "feather": _write_feather, "xlsx": _write_xlsx}
+
+# Export a G-code file or a (6, n) array; returns the number of rows written
+def export_toolpath(source, out_path, fmt=None, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None, on_block=None):
+    fmt = fmt or format_for(out_path)
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt} (use {', '.join(FORMATS)})")
+    root, ext = os.path.splitext(out_path)
+    tmp_path = root + ".partial" + ext     # keep the extension for the pandas engine lookup
+    try:
+        rows = WRITERS[fmt](iter_chunks(source, chunk_rows, on_block), tmp_path, progress)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export toolpath columns from a G-code program.")
+    parser.add_argument("program", help="G-code program (.txt)")
+    parser.add_argument("-f", "--format", choices=FORMATS, help="output format (default: from -o, else csv)")
+    parser.add_argument("-o", "--output", help="output file (default: next to the program)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows per write")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or (format_for(args.output) if args.output else "csv")
+    output = args.output or export_path(args.program, fmt)
+    rows = export_toolpath(args.program, output, fmt, args.chunk_rows)
+    print(f"{rows:,} rows -> {output}")
+
+if __name__ == "__main__":
+    main()